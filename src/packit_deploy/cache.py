@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def cache_dir() -> Path:
+    """
+    The directory used for packit-deploy's on-disk caches.
+
+    This is `$PACKIT_CACHE_DIR` if set, and otherwise a `packit-deploy`
+    directory within the user's cache directory (`$XDG_CACHE_HOME`, or
+    `~/.cache`). The directory is not created until something is written to it.
+    """
+    path = os.environ.get("PACKIT_CACHE_DIR")
+    if path:
+        return Path(path)
+    root = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(root, "packit-deploy")
+
+
+def read_json(path: Path, default):
+    """
+    Read a JSON cache file, returning `default` if it is missing or unreadable.
+
+    A corrupt cache is never an error; it is simply treated as empty.
+    """
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return default
+
+
+def write_atomically(path: Path, data: bytes, *, mode: int = 0o600) -> None:
+    """
+    Write a cache file so that concurrent readers never observe partial content.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -1,12 +1,21 @@
+import datetime as dt
+import json
 import os
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import click
 
-from packit_deploy.config import PackitConfig
-from packit_deploy.packit_constellation import PackitConstellation
+from packit_deploy import tracing
+
+# Importing the configuration and constellation modules pulls in docker,
+# requests, jinja2 and hvac, which makes up most of the CLI's startup time.
+# They are imported only by the commands that need them.
+if TYPE_CHECKING:
+    from packit_deploy.packit_constellation import PackitConstellation
 
 _HELP_NAME = "Override the configured instance, use with care!"
+_HELP_TRACE = "Record a trace of each deploy phase to this file (Chrome trace JSON, or JSON lines if it ends in .jsonl)"
 
 
 @click.group()
@@ -32,6 +41,8 @@ def cli_configure(name):
             print(f"Packit already configured as '{name}'")
     else:
         # Check that we can read the configuration before saving it.
+        from packit_deploy.config import PackitConfig
+
         PackitConfig(name)
         with IDENTITY_FILE.open("w") as f:
             f.write(name)
@@ -50,17 +61,39 @@ def cli_unconfigure():
 
 @cli.command("start")
 @click.option("--pull", is_flag=True, help="Pull images before start")
+@click.option(
+    "--parallel",
+    type=click.IntRange(min=1),
+    help="Start up to this many independent containers at once",
+)
+@click.option("--name", type=str, help=_HELP_NAME)
+@click.option("--trace", type=click.Path(dir_okay=False, writable=True), help=_HELP_TRACE)
+def cli_start(*, pull, name, parallel=None, trace=None, options=None):
+    with tracing.tracing(trace):
+        _constellation(name, options=options).start(pull_images=pull, parallel=parallel)
+
+
+@cli.command("apply")
+@click.option("--pull", is_flag=True, help="Pull images before applying changes")
 @click.option("--name", type=str, help=_HELP_NAME)
-def cli_start(*, pull, name, options=None):
-    _constellation(name, options=options).start(pull_images=pull)
+@click.option("--trace", type=click.Path(dir_okay=False, writable=True), help=_HELP_TRACE)
+def cli_apply(*, pull, name, trace=None, options=None):
+    """Recreate only the containers whose configuration has changed."""
+    with tracing.tracing(trace):
+        _constellation(name, options=options).apply(pull_images=pull)
 
 
 @cli.command("status")
 @click.option("--name", type=str, help=_HELP_NAME)
-def cli_status(name):
+@click.option("--json", "as_json", is_flag=True, help="Print status as JSON, including restart counts and uptimes")
+def cli_status(name, *, as_json=False):
     name = _read_identity(name)
-    print(f"Configured as '{name}'")
-    _constellation(name).status()
+    if as_json:
+        status = _constellation(name, resolve_secrets=False).status(detail=True)
+        print(json.dumps({"configured_as": name, **status.to_json()}, indent=2))
+    else:
+        print(f"Configured as '{name}'")
+        print(_constellation(name, resolve_secrets=False).status().format())
 
 
 @cli.command("stop")
@@ -68,11 +101,48 @@ def cli_status(name):
 @click.option("--network", is_flag=True, help="Remove the docker network")
 @click.option("--volumes", is_flag=True, help="Remove the docker volumes, causing permanent data loss")
 @click.option("--name", type=str, help=_HELP_NAME)
-def cli_stop(*, name, kill, network, volumes):
-    obj = _constellation(name)
-    if volumes:
-        _verify_data_loss(obj.cfg.protect_data)
-    obj.stop(kill=kill, remove_network=network, remove_volumes=volumes)
+@click.option("--trace", type=click.Path(dir_okay=False, writable=True), help=_HELP_TRACE)
+def cli_stop(*, name, kill, network, volumes, trace=None):
+    with tracing.tracing(trace):
+        obj = _constellation(name, resolve_secrets=False)
+        if volumes:
+            _verify_data_loss(obj.cfg.protect_data)
+        obj.stop(kill=kill, remove_network=network, remove_volumes=volumes)
+
+
+@cli.group("proxy")
+def cli_proxy():
+    """Manage the running proxy."""
+
+
+@cli_proxy.command("reload")
+@click.option("--name", type=str, help=_HELP_NAME)
+def cli_proxy_reload(name):
+    """Update the proxy's configuration without restarting it."""
+    _constellation(name).reload_proxy()
+
+
+@cli.group("logs")
+def cli_logs():
+    """Inspect the proxy's access logs."""
+
+
+@cli_logs.command("stats")
+@click.option("--since", type=str, help="Only include requests from this long ago, e.g. 30m, 6h or 7d")
+@click.option("--json", "as_json", is_flag=True, help="Print the statistics as JSON")
+@click.option("--name", type=str, help=_HELP_NAME)
+def cli_logs_stats(name, since=None, *, as_json=False):
+    """Show request latency percentiles and throughput, per instance and route."""
+    start = None
+    if since is not None:
+        from packit_deploy.config import duration_seconds
+
+        start = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=duration_seconds(since))
+    stats = _constellation(name, resolve_secrets=False).proxy_log_stats(since=start)
+    if as_json:
+        print(json.dumps(stats.to_json(), indent=2))
+    else:
+        print(stats.format())
 
 
 def _verify_data_loss(protect_data):
@@ -110,7 +180,11 @@ def _read_identity(name=None, *, required=True):
     return None
 
 
-def _constellation(name=None, options=None) -> PackitConstellation:
+def _constellation(name=None, options=None, *, resolve_secrets=True) -> "PackitConstellation":
+    from packit_deploy.config_cache import load_config
+    from packit_deploy.packit_constellation import PackitConstellation
+
     name = _read_identity(name)
-    cfg = PackitConfig(name, options=options)
-    return PackitConstellation(cfg)
+    with tracing.span("config"):
+        cfg = load_config(name, options=options)
+    return PackitConstellation(cfg, resolve_secrets=resolve_secrets)
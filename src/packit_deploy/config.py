@@ -1,7 +1,8 @@
 import dataclasses
+import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import ClassVar, Optional, Union
+from typing import ClassVar, Optional, Union, overload
 
 import constellation
 from constellation import BuildSpec, config
@@ -35,6 +36,67 @@ def config_ref(dat, key: list[str], *, repo: str) -> constellation.ImageReferenc
     return constellation.ImageReference(repo, name, tag)
 
 
+def config_duration(dat, key: list[str], *, default: str) -> str:
+    """
+    Parse a duration in nginx's format, e.g. `500ms`, `15s` or `1h`.
+    """
+    value = config.config_string(dat, key, is_optional=True, default=default)
+    if not re.fullmatch(r"[0-9]+(ms|s|m|h|d)?", value):
+        msg = f"Invalid duration '{value}' for {':'.join(key)}"
+        raise ValueError(msg)
+    return value
+
+
+def duration_seconds(value: str) -> int:
+    """
+    Convert a duration in nginx's format to whole seconds (at least one).
+    """
+    m = re.fullmatch(r"([0-9]+)(ms|s|m|h|d)?", value)
+    if m is None:
+        msg = f"Invalid duration '{value}'"
+        raise ValueError(msg)
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2) or "s"]
+    return max(1, round(int(m.group(1)) * scale))
+
+
+@overload
+def config_size(dat, key: list[str], *, default: str) -> str: ...
+
+
+@overload
+def config_size(dat, key: list[str], *, default: None) -> Optional[str]: ...
+
+
+def config_size(dat, key: list[str], *, default: Optional[str]) -> Optional[str]:
+    """
+    Parse a size in nginx's format, e.g. `512k`, `100m` or `10g`.
+    """
+    value = config.config_string(dat, key, is_optional=True, default=default)
+    if value is not None and not re.fullmatch(r"[0-9]+[kKmMgG]?", value):
+        msg = f"Invalid size '{value}' for {':'.join(key)}"
+        raise ValueError(msg)
+    return value
+
+
+def size_bytes(value: str) -> int:
+    """
+    Convert a size in nginx's format to a number of bytes.
+    """
+    m = re.fullmatch(r"([0-9]+)([kKmMgG]?)", value)
+    if m is None:
+        msg = f"Invalid size '{value}'"
+        raise ValueError(msg)
+    return int(m.group(1)) * 1024 ** " kmg".index(m.group(2).lower() or " ")
+
+
+def config_startup_timeout(dat, key: list[str], *, default: int) -> int:
+    value = config.config_integer(dat, key, is_optional=True, default=default)
+    if value <= 0:
+        msg = f"Expected a positive number of seconds for {':'.join(key)}"
+        raise ValueError(msg)
+    return value
+
+
 def config_buildable(dat, key: list[str], *, repo: str, root: str) -> Union["BuildSpec", constellation.ImageReference]:
     build = config_path(dat, [*key, "build"], is_optional=True, root=root)
     if build is not None:
@@ -186,12 +248,16 @@ class ContainerConfig:
 
     container_name: str
     image: constellation.ImageReference
+    # How long (in seconds) `start` waits for the container to report itself
+    # healthy, for those that have a healthcheck.
+    startup_timeout: int = 60
 
     @classmethod
     def from_data(cls, dat, key: list[str], *, container_name: str, ctx: Context) -> "ContainerConfig":
         return ContainerConfig(
             container_name=ctx.container_name(container_name),
             image=config_ref(dat, key, repo=ctx.repo),
+            startup_timeout=config_startup_timeout(dat, [*key, "startup_timeout"], default=60),
         )
 
 
@@ -207,11 +273,14 @@ class PackitAPI:
     runner_git_url: Optional[str]
     runner_git_ssh_key: Optional[str]
     default_roles: str
+    # The JVM can take a few minutes to come up, particularly on first start.
+    startup_timeout: int
 
     @classmethod
     def from_data(cls, dat, key: list[str], *, ctx: Context) -> "PackitAPI":
         image = config_ref(dat, [*key, "api"], repo=ctx.repo)
         management_port = config.config_integer(dat, [*key, "api", "management_port"], is_optional=True, default=8081)
+        startup_timeout = config_startup_timeout(dat, [*key, "api", "startup_timeout"], default=300)
         base_url = config.config_string(dat, [*key, "base_url"])
         default_roles = config.config_string(dat, [*key, "default_roles"], is_optional=True, default="")
 
@@ -239,6 +308,7 @@ class PackitAPI:
             runner_git_url=runner_git_url,
             runner_git_ssh_key=runner_git_ssh_key,
             default_roles=default_roles,
+            startup_timeout=startup_timeout,
         )
 
 
@@ -305,6 +375,220 @@ class SSL:
     key: str
 
 
+@dataclass
+class Upstream:
+    """
+    How the proxy reuses connections to the backends behind it.
+
+    `keepalive` is the number of idle connections each nginx worker keeps open
+    to each backend. `keepalive_timeout` should be shorter than the backends'
+    own idle timeouts, so that nginx never reuses a connection that the
+    backend is about to close.
+
+    nginx looks up the backends' addresses as it runs, and uses an address
+    for up to `resolver_ttl` before looking it up again; a recreated backend
+    is picked up within this time.
+    """
+
+    keepalive: int
+    keepalive_requests: int
+    keepalive_timeout: str
+    resolver_ttl: str
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> "Upstream":
+        keepalive = config.config_integer(dat, [*key, "keepalive"], is_optional=True, default=16)
+        keepalive_requests = config.config_integer(dat, [*key, "keepalive_requests"], is_optional=True, default=1000)
+        keepalive_timeout = config_duration(dat, [*key, "keepalive_timeout"], default="15s")
+        resolver_ttl = config_duration(dat, [*key, "resolver_ttl"], default="10s")
+        return Upstream(keepalive, keepalive_requests, keepalive_timeout, resolver_ttl)
+
+
+@dataclass
+class ProxyTuning:
+    """
+    Settings for nginx's workers and buffers. Settings that are not given
+    keep nginx's defaults. `client_max_body_size` applies to every instance,
+    unless overridden in the instance's own `proxy` section.
+
+    Without `upload_request_buffering`, uploads to outpack are streamed
+    straight to packit-api rather than being spooled to disk first.
+    """
+
+    worker_processes: str
+    worker_connections: int
+    proxy_buffer_size: Optional[str]
+    proxy_buffers: Optional[str]
+    client_body_buffer_size: Optional[str]
+    client_max_body_size: Optional[str]
+    upload_request_buffering: bool
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> "ProxyTuning":
+        path = [*key, "worker_processes"]
+        try:
+            worker_processes = str(config.config_integer(dat, path, is_optional=True, default="auto"))
+        except ValueError:
+            worker_processes = config.config_string(dat, path)
+        if not re.fullmatch(r"auto|[1-9][0-9]*", worker_processes):
+            msg = f"Expected 'auto' or a number of processes for {':'.join(path)}"
+            raise ValueError(msg)
+        proxy_buffers = config.config_string(dat, [*key, "proxy_buffers"], is_optional=True)
+        if proxy_buffers is not None and not re.fullmatch(r"[0-9]+ [0-9]+[kKmMgG]?", proxy_buffers):
+            msg = f"Invalid buffers '{proxy_buffers}' for {':'.join([*key, 'proxy_buffers'])}, expected e.g. '8 16k'"
+            raise ValueError(msg)
+        return ProxyTuning(
+            worker_processes=worker_processes,
+            worker_connections=config.config_integer(dat, [*key, "worker_connections"], is_optional=True, default=1024),
+            proxy_buffer_size=config_size(dat, [*key, "proxy_buffer_size"], default=None),
+            proxy_buffers=proxy_buffers,
+            client_body_buffer_size=config_size(dat, [*key, "client_body_buffer_size"], default=None),
+            client_max_body_size=config_size(dat, [*key, "client_max_body_size"], default=None),
+            upload_request_buffering=config.config_boolean(
+                dat, [*key, "upload_request_buffering"], is_optional=True, default=True
+            ),
+        )
+
+
+@dataclass
+class ProxyCache:
+    """
+    An on-disk cache of the immutable outpack content served through the proxy.
+
+    The cache is kept at `path` in the proxy container, on its own volume.
+    Entries not requested for `inactive` are evicted, as are the least
+    recently used entries once the cache grows beyond `size`.
+    """
+
+    path: str
+    size: str
+    inactive: str
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> Optional["ProxyCache"]:
+        if config.config_dict(dat, key, is_optional=True) is None:
+            return None
+        path = config.config_string(dat, [*key, "path"], is_optional=True, default="/var/cache/nginx/packit")
+        size = config_size(dat, [*key, "size"], default="10g")
+        inactive = config_duration(dat, [*key, "inactive"], default="30d")
+        return ProxyCache(path, size, inactive)
+
+
+@dataclass
+class Compression:
+    """
+    Compression of the responses sent by the proxy, including those from the
+    backends. Responses are compressed with gzip; brotli is not available in
+    the stock nginx image the proxy is built from.
+    """
+
+    MAX_LEVEL: ClassVar[int] = 9
+    DEFAULT_TYPES: ClassVar[list[str]] = [
+        "application/javascript",
+        "application/json",
+        "application/xml",
+        "image/svg+xml",
+        "text/css",
+        "text/javascript",
+        "text/plain",
+    ]
+
+    level: int
+    min_length: int
+    # HTML is always compressed, so is not listed here.
+    types: list[str]
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> Optional["Compression"]:
+        if config.config_dict(dat, key, is_optional=True) is None:
+            return None
+        algorithms = config.config_list(dat, [*key, "algorithms"], is_optional=True, default=["gzip"])
+        unsupported = [x for x in algorithms if x != "gzip"]
+        if unsupported:
+            msg = f"Unsupported compression for {':'.join(key)}: {', '.join(unsupported)} (only gzip is available)"
+            raise ValueError(msg)
+        level = config.config_integer(dat, [*key, "level"], is_optional=True, default=5)
+        if not 1 <= level <= cls.MAX_LEVEL:
+            msg = f"Expected a level between 1 and {cls.MAX_LEVEL} for {':'.join(key)}:level"
+            raise ValueError(msg)
+        min_length = config.config_integer(dat, [*key, "min_length"], is_optional=True, default=1024)
+        types = config.config_list(dat, [*key, "types"], is_optional=True, default=cls.DEFAULT_TYPES)
+        return Compression(level, min_length, [x for x in types if x != "text/html"])
+
+
+@dataclass
+class Microcache:
+    """
+    A short-lived cache of the packit app's responses to anonymous GET
+    requests, kept in the proxy container (it is not worth a volume). Requests
+    carrying credentials or cookies always go to the app.
+    """
+
+    duration: str
+    size: str
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> Optional["Microcache"]:
+        if config.config_dict(dat, key, is_optional=True) is None:
+            return None
+        duration = config_duration(dat, [*key, "duration"], default="5s")
+        size = config_size(dat, [*key, "size"], default="50m")
+        return Microcache(duration, size)
+
+
+@dataclass
+class ProxyTls:
+    """
+    TLS performance settings for the proxy: HTTP/2, the size of the shared
+    session cache, how long sessions can be resumed for, and session tickets.
+
+    Session ticket keys are generated by the proxy and replaced every
+    `ticket_key_rotation`. They are kept in /run/proxy, on the `packit-tls`
+    volume. OCSP responses are only stapled for certificates from acme-buddy.
+    """
+
+    http2: bool
+    session_cache: str
+    session_timeout: str
+    session_tickets: bool
+    ticket_key_rotation: str
+    ocsp_stapling: bool
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> Optional["ProxyTls"]:
+        if config.config_dict(dat, key, is_optional=True) is None:
+            return None
+        return ProxyTls(
+            http2=config.config_boolean(dat, [*key, "http2"], is_optional=True, default=True),
+            session_cache=config_size(dat, [*key, "session_cache"], default="10m"),
+            session_timeout=config_duration(dat, [*key, "session_timeout"], default="1d"),
+            session_tickets=config.config_boolean(dat, [*key, "session_tickets"], is_optional=True, default=True),
+            ticket_key_rotation=config_duration(dat, [*key, "ticket_key_rotation"], default="12h"),
+            ocsp_stapling=config.config_boolean(dat, [*key, "ocsp_stapling"], is_optional=True, default=True),
+        )
+
+
+@dataclass
+class AccessLog:
+    """
+    Rotation of the proxy's JSON access log, which is kept on the proxy_logs
+    volume for `packit logs stats`. Once it grows beyond `max_size` it is
+    compressed and a new log started; `keep` compressed logs are retained.
+    """
+
+    max_size: str
+    keep: int
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> "AccessLog":
+        max_size = config_size(dat, [*key, "max_size"], default="100m")
+        keep = config.config_integer(dat, [*key, "keep"], is_optional=True, default=5)
+        if keep < 1:
+            msg = f"Expected at least one log to keep for {':'.join(key)}:keep"
+            raise ValueError(msg)
+        return AccessLog(max_size, keep)
+
+
 @dataclass
 class Proxy:
     container_name: ClassVar[str] = "proxy"
@@ -315,6 +599,16 @@ class Proxy:
     port_https: int
     # port at which proxy will provide api and outpack server metrics. Different from PackitAPI management_port!
     port_metrics: Optional[int]
+    upstream: Upstream
+    cache: Optional[ProxyCache]
+    compression: Optional[Compression]
+    microcache: Optional[Microcache]
+    tls: Optional[ProxyTls]
+    tuning: ProxyTuning
+    access_log: AccessLog
+    # Serve outpack files directly from the outpack volumes, rather than
+    # through packit-api and outpack_server.
+    serve_outpack_files: bool
 
     @classmethod
     def from_data(cls, dat, key: list[str], *, ctx: Context) -> "Proxy":
@@ -323,6 +617,14 @@ class Proxy:
         port_http = config.config_integer(dat, [*key, "port_http"])
         port_https = config.config_integer(dat, [*key, "port_https"])
         port_metrics = config.config_integer(dat, [*key, "port_metrics"], is_optional=True)
+        upstream = Upstream.from_data(dat, [*key, "upstream"])
+        cache = ProxyCache.from_data(dat, [*key, "cache"])
+        compression = Compression.from_data(dat, [*key, "compression"])
+        microcache = Microcache.from_data(dat, [*key, "microcache"])
+        tls = ProxyTls.from_data(dat, [*key, "tls"])
+        tuning = ProxyTuning.from_data(dat, [*key, "tuning"])
+        access_log = AccessLog.from_data(dat, [*key, "access_log"])
+        serve_outpack_files = config.config_boolean(dat, [*key, "serve_outpack_files"], is_optional=True, default=False)
 
         return Proxy(
             image=image,
@@ -330,9 +632,51 @@ class Proxy:
             port_http=port_http,
             port_https=port_https,
             port_metrics=port_metrics,
+            upstream=upstream,
+            cache=cache,
+            serve_outpack_files=serve_outpack_files,
+            compression=compression,
+            microcache=microcache,
+            tls=tls,
+            tuning=tuning,
+            access_log=access_log,
         )
 
 
+@dataclass
+class RequestLimit:
+    """
+    Limits on the requests the proxy passes to part of an instance (its API
+    or the app), to stop one busy instance from slowing down the others.
+
+    Requests beyond `rate` (e.g. `10r/s` or `600r/m`), allowing a `burst` of
+    that many more, and beyond `connections` open at once, are refused with
+    status 429. Limits apply to all clients together, or to each client
+    separately with `per_client`.
+    """
+
+    rate: Optional[str]
+    burst: int
+    connections: Optional[int]
+    per_client: bool
+
+    @classmethod
+    def from_data(cls, dat, key: list[str]) -> Optional["RequestLimit"]:
+        if config.config_dict(dat, key, is_optional=True) is None:
+            return None
+        rate = config.config_string(dat, [*key, "rate"], is_optional=True)
+        if rate is not None and not re.fullmatch(r"[0-9]+r/[sm]", rate):
+            msg = f"Invalid rate '{rate}' for {':'.join([*key, 'rate'])}, expected e.g. '10r/s'"
+            raise ValueError(msg)
+        connections = config.config_integer(dat, [*key, "connections"], is_optional=True)
+        if rate is None and connections is None:
+            msg = f"Expected a rate or a number of connections for {':'.join(key)}"
+            raise ValueError(msg)
+        burst = config.config_integer(dat, [*key, "burst"], is_optional=True, default=0)
+        per_client = config.config_boolean(dat, [*key, "per_client"], is_optional=True, default=False)
+        return RequestLimit(rate, burst, connections, per_client)
+
+
 @dataclass
 class PackitInstance:
     outpack_server: ContainerConfig
@@ -340,6 +684,10 @@ class PackitInstance:
     packit_api: PackitAPI
     packit_db: PackitDB
     brand: Branding
+    # Overrides the proxy's `tuning.client_max_body_size` for this instance
+    client_max_body_size: Optional[str]
+    # Limits on requests to "api" and "app", if any
+    limits: dict[str, RequestLimit]
 
     # The handling of volumes in Constellation is a bit rigid and weird.
     # - Every volume has an ID that is (generally) a constant.
@@ -374,6 +722,14 @@ class PackitInstance:
         packit_api = PackitAPI.from_data(dat, [*key, "packit"], ctx=ctx)
         packit_db = PackitDB.from_data(dat, [*key, "packit", "db"], ctx=ctx)
         brand = Branding.from_data(dat, [*key, "brand"], ctx=ctx)
+        # With a single instance, the proxy section is the proxy's own
+        client_max_body_size = config_size(dat, [*key, "proxy", "client_max_body_size"], default=None) if key else None
+        # With a single instance, limits go in the proxy's own section
+        limits = {}
+        for scope in ("api", "app"):
+            limit = RequestLimit.from_data(dat, [*key, "proxy", "limits", scope])
+            if limit is not None:
+                limits[scope] = limit
 
         volume_id_outpack = ctx.volume_id("outpack")
         volume_id_packit_db = ctx.volume_id("packit_db")
@@ -396,6 +752,8 @@ class PackitInstance:
             packit_api=packit_api,
             packit_db=packit_db,
             brand=brand,
+            client_max_body_size=client_max_body_size,
+            limits=limits,
             volume_id_outpack=volume_id_outpack,
             volume_id_packit_db=volume_id_packit_db,
             volume_id_packit_db_backup=volume_id_packit_db_backup,
@@ -438,9 +796,12 @@ class PackitConfig:
     # In cases where a single unnamed instance is hosted, the key is None.
     instances: dict[Optional[str], PackitInstance]
 
-    def __init__(self, path, extra=None, options=None) -> None:
-        dat = config.read_yaml(f"{path}/packit.yml")
-        dat = config.config_build(path, dat, extra, options)
+    def __init__(self, path, extra=None, options=None, *, data=None) -> None:
+        # `data` is the already parsed contents of packit.yml, if available
+        # (see `config_cache.load_config`).
+        if data is None:
+            data = config.read_yaml(f"{path}/packit.yml")
+        dat = config.config_build(path, data, extra, options)
         self.vault = config.config_vault(dat, ["vault"])
         self.network = config.config_string(dat, ["network"])
         self.protect_data = config.config_boolean(dat, ["protect_data"])
@@ -462,15 +823,23 @@ class PackitConfig:
         if "proxy" in dat and config.config_boolean(dat, ["proxy", "enabled"]):
             self.proxy = Proxy.from_data(dat, ["proxy"], ctx=ctx)
             self.volumes["proxy_logs"] = config.config_string(dat, ["volumes", "proxy_logs"])
+            if self.proxy.cache is not None:
+                self.volumes["proxy_cache"] = config.config_string(dat, ["volumes", "proxy_cache"])
         else:
             self.proxy = None
 
         if "acme_buddy" in dat:
             self.acme_config = config.config_acme(dat, "acme_buddy")
-            self.volumes["packit-tls"] = "packit-tls"
         else:
             self.acme_config = None
 
+        # Certificates, from acme-buddy or self-signed, are kept here so that
+        # they outlive the proxy container.
+        if self.proxy is not None or self.acme_config is not None:
+            self.volumes["packit-tls"] = config.config_string(
+                dat, ["volumes", "proxy_tls"], is_optional=True, default="packit-tls"
+            )
+
         instances = config.config_dict(dat, ["instances"], is_optional=True)
         if instances is not None:
             self.instances = {
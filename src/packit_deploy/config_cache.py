@@ -0,0 +1,62 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional
+
+import yaml
+from constellation import config
+
+from packit_deploy.__about__ import __version__
+from packit_deploy.cache import cache_dir, read_json, write_atomically
+from packit_deploy.config import PackitConfig
+
+
+def load_config(path: str, extra: Optional[str] = None, options=None, *, cache: bool = True) -> PackitConfig:
+    """
+    Read a configuration, reusing the parsed contents of `packit.yml` from a
+    previous read if the file has not changed.
+
+    Parsing the YAML is most of the cost of reading a large configuration, so
+    that is what is cached. The parse result is stored as JSON, keyed on the
+    contents of `packit.yml` and the version of packit-deploy, before
+    environment variables are substituted: the cache holds nothing that is
+    not in `packit.yml` itself, and references like `$DB_PASSWORD` (like
+    vault secrets) are resolved every time the configuration is read.
+    """
+    data = read_packit_yml(path) if cache else None
+    return PackitConfig(path, extra, options, data=data)
+
+
+def read_packit_yml(path: str) -> Any:
+    """
+    Parse `packit.yml` as constellation's `read_yaml` would, through the cache.
+    """
+    content = Path(path, "packit.yml").read_bytes()
+    key = _digest(f"{__version__}\0".encode() + content)
+    filename = cache_dir() / f"config-{_digest(str(Path(path).resolve()).encode('utf-8'))[:16]}.json"
+    entry = read_json(filename, None)
+    if isinstance(entry, dict) and entry.get("key") == key:
+        data = entry["data"]
+    else:
+        data = yaml.load(content, Loader=yaml.SafeLoader)
+        _write_cache(filename, key, data)
+    return config.parse_env_vars(data)
+
+
+def _write_cache(filename: Path, key: str, data: Any) -> None:
+    try:
+        encoded = json.dumps({"key": key, "data": data})
+    except (TypeError, ValueError):
+        # Values with no JSON equivalent (e.g., dates) are not cached
+        return
+    # Nor are those that JSON would change, like non-string keys
+    if json.loads(encoded)["data"] != data:
+        return
+    try:
+        write_atomically(filename, encoded.encode("utf-8"))
+    except OSError:
+        pass
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
@@ -1,4 +1,6 @@
 import os.path
+import time
+from collections.abc import Callable
 from io import BytesIO
 from tarfile import TarFile, TarInfo
 
@@ -50,3 +52,47 @@ def write_to_container(data: bytes, container: Container, path: str, *, mode: in
         tar.addfile(info, BytesIO(data))
 
     container.put_archive(os.path.dirname(path), buffer.getvalue())
+
+
+# Rewrite a set of text files in a container, preserving their ownership and
+# mode.
+#
+# `edits` maps each file's path to a function that takes the current content
+# and returns the new content. The files are read with get_archive (which
+# includes their ownership and mode in the tar headers) and all written back
+# with a single put_archive, rooted at their common parent directory.
+#
+# Like write_to_container, this does not execute anything in the container.
+def patch_files(container: Container, edits: dict[str, Callable[[str], str]]):
+    if not edits:
+        return
+
+    root = os.path.commonpath([os.path.dirname(path) for path in edits])
+    buffer = BytesIO()
+    with TarFile(fileobj=buffer, mode="w") as tar:
+        for path, edit in edits.items():
+            prev, content = _read_file_from_container(container, path)
+            data = edit(content.decode("utf-8")).encode("utf-8")
+
+            info = TarInfo(name=os.path.relpath(path, root))
+            info.mode = prev.mode
+            info.uid = prev.uid
+            info.gid = prev.gid
+            info.uname = prev.uname
+            info.gname = prev.gname
+            info.mtime = int(time.time())
+            info.size = len(data)
+            tar.addfile(info, BytesIO(data))
+
+    container.put_archive(root, buffer.getvalue())
+
+
+def _read_file_from_container(container: Container, path: str) -> tuple[TarInfo, bytes]:
+    stream, _stat = container.get_archive(path)
+    with TarFile(fileobj=BytesIO(b"".join(stream))) as tar:
+        info = tar.getmember(os.path.basename(path))
+        f = tar.extractfile(info)
+        if not info.isfile() or f is None:
+            msg = f"'{path}' is not a regular file"
+            raise Exception(msg)
+        return info, f.read()
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import re
+from typing import Any, Union
+
+import docker
+from constellation import (
+    Constellation,
+    ConstellationBindMount,
+    ConstellationContainer,
+    ConstellationService,
+    ConstellationVolumeMount,
+)
+from constellation.constellation import ConstellationVolumeCollection
+from docker.models.containers import Container
+
+# Label on every container started by packit-deploy, recording the
+# fingerprint of the configuration it was created from.
+FINGERPRINT_LABEL = "packit-deploy.fingerprint"
+
+
+def container_fingerprint(
+    x: Union[ConstellationContainer, ConstellationService],
+    image_id: str,
+    volumes: ConstellationVolumeCollection,
+    payload: Any = None,
+) -> str:
+    """
+    Compute a digest of everything that determines how a container is created.
+
+    This covers the image, command line, environment, mounts and ports, plus an
+    arbitrary JSON-serialisable `payload` describing whatever the container's
+    preconfigure and configure hooks write into it. Two containers with the
+    same fingerprint are interchangeable.
+    """
+    if isinstance(x, ConstellationService):
+        base = x.base
+        payload = {"scale": x.scale, "payload": payload}
+    else:
+        base = x
+
+    data = {
+        "image": image_id,
+        "args": base.args,
+        "entrypoint": base.entrypoint,
+        "working_dir": base.working_dir,
+        "environment": base.environment or {},
+        "mounts": [_describe_mount(m, volumes) for m in base.mounts],
+        "ports": sorted((base.ports_config or {}).items()),
+        "payload": payload,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def set_fingerprint(x: Union[ConstellationContainer, ConstellationService], fingerprint: str) -> None:
+    """
+    Arrange for a container to be labelled with its fingerprint when created.
+    """
+    if isinstance(x, ConstellationService):
+        # Service replicas are created from the kwargs, not from the base.
+        labels = {**(x.kwargs.get("labels") or {}), FINGERPRINT_LABEL: fingerprint}
+        x.kwargs["labels"] = labels
+        x.base.labels = labels
+    else:
+        x.labels = {**(x.labels or {}), FINGERPRINT_LABEL: fingerprint}
+
+
+def is_current(x: Union[ConstellationContainer, ConstellationService], prefix: str, fingerprint: str) -> bool:
+    """
+    Check whether a container is running and was created with the given fingerprint.
+
+    For services, every replica must be running and up to date, and there must
+    be the expected number of them.
+    """
+    if isinstance(x, ConstellationService):
+        found = x.get(prefix, stopped=True)
+        if len(found) != x.scale:
+            return False
+    else:
+        container = x.get(prefix)
+        if container is None:
+            return False
+        found = [container]
+    return all(c.status == "running" and c.labels.get(FINGERPRINT_LABEL) == fingerprint for c in found)
+
+
+def orphaned_containers(client: docker.DockerClient, obj: Constellation) -> list[Container]:
+    """
+    Find the containers packit-deploy created for a constellation that no
+    longer correspond to anything in its configuration, such as those of an
+    instance that has since been removed.
+    """
+    names = set()
+    replica_prefixes = []
+    for x in obj.containers.collection:
+        if isinstance(x, ConstellationService):
+            # Replicas are named after the service, with a random suffix.
+            replica_prefixes.append(f"{x.base.name_external(obj.prefix)}-")
+        else:
+            names.add(x.name_external(obj.prefix))
+    pattern = f"^/{re.escape(obj.prefix)}-"
+    found = client.containers.list(all=True, filters={"label": FINGERPRINT_LABEL, "name": pattern})
+    return [c for c in found if c.name not in names and not (c.name or "").startswith(tuple(replica_prefixes))]
+
+
+def resolve_image_id(client: docker.DockerClient, x: Union[ConstellationContainer, ConstellationService]) -> str:
+    """
+    Find the id of the local image a container would be created from.
+
+    This must be called after the container's image has been prepared.
+    """
+    image_id = x.base.image_id if isinstance(x, ConstellationService) else x.image_id
+    return str(client.images.get(image_id).id)
+
+
+def _describe_mount(mount, volumes: ConstellationVolumeCollection) -> dict:
+    if isinstance(mount, ConstellationVolumeMount):
+        source = volumes.get(mount.name)
+    elif isinstance(mount, ConstellationBindMount):
+        source = mount.source
+    else:  # pragma: no cover
+        msg = f"Unsupported mount type {type(mount)}"
+        raise Exception(msg)
+    return {"source": source, "target": mount.target, **mount.kwargs}
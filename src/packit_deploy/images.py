@@ -0,0 +1,284 @@
+import json
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import constellation
+import docker
+from docker.models.images import Image
+from docker.utils import parse_repository_tag
+
+from packit_deploy import tracing
+from packit_deploy.cache import cache_dir, read_json, write_atomically
+from packit_deploy.config import PackitConfig
+
+# Number of images pulled at once by `pull_images`. Pulls are mostly bound by
+# network and registry throughput, so a handful in flight is plenty.
+PULL_WORKERS = 4
+
+# How long (in seconds) a registry's manifest digest is trusted before asking
+# the registry again.
+MANIFEST_TTL = 300
+
+
+def image_references(cfg: PackitConfig) -> list[str]:
+    """
+    Collect the unique image references used by a configuration.
+
+    Images that are built locally (rather than pulled from a registry) are not
+    included. The references are returned in the order they first appear.
+    """
+    refs: list[constellation.ImageReference] = []
+    for instance in cfg.instances.values():
+        refs += [
+            instance.outpack_server.image,
+            instance.packit_db.image,
+            instance.packit_api.image,
+            instance.packit_app.image,
+        ]
+
+    if cfg.proxy is not None and isinstance(cfg.proxy.image, constellation.ImageReference):
+        refs.append(cfg.proxy.image)
+    if cfg.acme_config is not None:
+        refs.append(cfg.acme_config.ref)
+    if cfg.orderly_runner is not None:
+        refs += [cfg.orderly_runner.redis.image, cfg.orderly_runner.api.image, cfg.orderly_runner.worker.image]
+
+    return list(dict.fromkeys(str(x) for x in refs))
+
+
+class ManifestCache:
+    """
+    A small on-disk record of the manifest digest each registry last reported
+    for an image reference.
+
+    Entries older than `ttl` seconds are ignored, so that a tag which has moved
+    upstream is noticed reasonably quickly.
+    """
+
+    def __init__(self, path: Path, *, ttl: float = MANIFEST_TTL, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        entries = read_json(path, {})
+        # Anything that isn't a well-formed entry is just a cache miss
+        self._entries: dict[str, dict] = {}
+        if isinstance(entries, dict):
+            self._entries = {k: v for k, v in entries.items() if _is_entry(v)}
+
+    @classmethod
+    def default(cls) -> "ManifestCache":
+        return cls(cache_dir() / "manifests.json")
+
+    def get(self, ref: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(ref)
+        if entry is None or self._clock() - entry["checked"] > self.ttl:
+            return None
+        return entry["digest"]
+
+    def set(self, ref: str, digest: str) -> None:
+        with self._lock:
+            self._entries[ref] = {"digest": digest, "checked": self._clock()}
+
+    def save(self) -> None:
+        """
+        Write the cache back to disk. Failing to do so is not an error; the
+        registry is just asked again next time.
+        """
+        with self._lock:
+            data = json.dumps(self._entries, indent=2)
+        try:
+            write_atomically(self.path, data.encode("utf-8"))
+        except OSError:
+            pass
+
+
+def _is_entry(entry: Any) -> bool:
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get("digest"), str)
+        and isinstance(entry.get("checked"), (int, float))
+    )
+
+
+def registry_digest(client: docker.DockerClient, ref: str) -> str:
+    """
+    Look up the manifest digest for an image reference from its registry.
+
+    This only fetches the manifest (via the docker daemon, so using its
+    credentials), which is far cheaper than a pull.
+    """
+    return client.images.get_registry_data(ref).id
+
+
+@dataclass
+class PullResult:
+    ref: str
+    image_id: str
+    updated: bool
+    # Bytes downloaded: the compressed size of the layers that were not
+    # already present locally.
+    size: int
+    seconds: float
+    skipped: bool = False
+
+
+def pull_images(
+    refs: list[str],
+    *,
+    max_workers: int = PULL_WORKERS,
+    cache: Optional[ManifestCache] = None,
+    lookup: Callable[[docker.DockerClient, str], str] = registry_digest,
+) -> list[PullResult]:
+    """
+    Pull a set of images concurrently, reporting progress as each completes.
+
+    If a `cache` is given, images whose local digest already matches the
+    registry's manifest digest are not pulled at all. The registry is only
+    consulted (via `lookup`) when the cached digest has expired.
+
+    Returns a summary of each pull, in the same order as `refs`.
+    """
+    if not refs:
+        return []
+
+    client = docker.client.from_env()
+    lock = threading.Lock()
+    completed = 0
+
+    def pull(ref: str) -> PullResult:
+        nonlocal completed
+        with tracing.span("pull", image=ref):
+            result = _pull_one(client, ref, cache, lookup)
+        with lock:
+            completed += 1
+            if result.skipped:
+                print(f"[{completed}/{len(refs)}] {ref} is up to date ({result.image_id})")
+            else:
+                status = "updated" if result.updated else "unchanged"
+                print(
+                    f"[{completed}/{len(refs)}] Pulled {ref} -> {result.image_id} ({status}) "
+                    f"in {result.seconds:.1f}s, {format_bytes(result.size)} downloaded"
+                )
+        return result
+
+    print(f"Pulling {len(refs)} images, up to {max_workers} at a time")
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers) as pool:
+            results = list(pool.map(pull, refs))
+    finally:
+        if cache is not None:
+            cache.save()
+    elapsed = time.monotonic() - start
+
+    total = sum(x.size for x in results)
+    updated = sum(x.updated for x in results)
+    skipped = sum(x.skipped for x in results)
+    print(
+        f"Pulled {len(results) - skipped} images ({updated} updated, {skipped} already current, "
+        f"{format_bytes(total)} downloaded) in {elapsed:.1f}s"
+    )
+    return results
+
+
+def _pull_one(
+    client: docker.DockerClient,
+    ref: str,
+    cache: Optional[ManifestCache],
+    lookup: Callable[[docker.DockerClient, str], str],
+) -> PullResult:
+    start = time.monotonic()
+    prev = _local_image(client, ref)
+    if cache is not None and prev is not None and _is_current(client, ref, prev, cache, lookup):
+        return PullResult(
+            ref=ref,
+            image_id=prev.short_id,
+            updated=False,
+            size=0,
+            seconds=time.monotonic() - start,
+            skipped=True,
+        )
+
+    image, downloaded = _pull(client, ref)
+    seconds = time.monotonic() - start
+    if cache is not None:
+        digests = _repo_digests(image)
+        if len(digests) == 1:
+            cache.set(ref, digests.pop())
+    return PullResult(
+        ref=ref,
+        image_id=image.short_id,
+        updated=prev is None or image.id != prev.id,
+        size=downloaded,
+        seconds=seconds,
+    )
+
+
+def _pull(client: docker.DockerClient, ref: str) -> tuple[Image, int]:
+    """
+    Pull an image as `client.images.pull` does, but also count the bytes
+    downloaded, from the progress docker reports for each layer.
+    """
+    # NOTE: pulling without a tag pulls *every* tag; our references always
+    # include one.
+    repository, tag = parse_repository_tag(ref)
+    sizes: dict[str, int] = {}
+    for event in client.api.pull(repository, tag=tag, stream=True, decode=True):
+        if "error" in event:
+            msg = f"Failed to pull {ref}: {event['error']}"
+            raise Exception(msg)
+        # Layers that are already present are reported as such, and never
+        # downloaded.
+        total = (event.get("progressDetail") or {}).get("total")
+        if event.get("status") == "Downloading" and total:
+            sizes[event["id"]] = total
+    return client.images.get(ref), sum(sizes.values())
+
+
+def _is_current(
+    client: docker.DockerClient,
+    ref: str,
+    image: Image,
+    cache: ManifestCache,
+    lookup: Callable[[docker.DockerClient, str], str],
+) -> bool:
+    digest = cache.get(ref)
+    if digest is None:
+        try:
+            digest = lookup(client, ref)
+        except docker.errors.APIError as e:
+            print(f"Could not check registry for {ref}, pulling it instead: {e}")
+            return False
+        cache.set(ref, digest)
+    return digest in _repo_digests(image)
+
+
+def _local_image(client: docker.DockerClient, ref: str) -> Optional[Image]:
+    try:
+        return client.images.get(ref)
+    except docker.errors.ImageNotFound:
+        return None
+
+
+def _repo_digests(image: Image) -> set[str]:
+    # RepoDigests look like 'ghcr.io/mrc-ide/packit@sha256:...', where the
+    # repository name may have been normalised by docker; only the digest
+    # itself is useful for comparison.
+    return {x.split("@", 1)[1] for x in image.attrs.get("RepoDigests", []) if "@" in x}
+
+
+def format_bytes(n: float) -> str:
+    if n < 1000:  # noqa: PLR2004
+        return f"{int(n)} B"
+    for unit in ["kB", "MB", "GB"]:
+        n /= 1000
+        if n < 1000:  # noqa: PLR2004
+            return f"{n:.1f} {unit}"
+    return f"{n / 1000:.1f} TB"
@@ -0,0 +1,203 @@
+import datetime as dt
+import gzip
+import io
+import json
+import math
+import re
+import tarfile
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+# Where the proxy writes its access log, in the format `packit` from
+# nginx-main.conf.j2. Copies compressed by the proxy's rotate-access-log
+# (packit-access.log.1.gz, ...) are read too.
+LOG_DIR = "/var/log/nginx"
+ACCESS_LOG_PATTERN = re.compile(r"packit-access\.log(\.[0-9]+)?(\.gz)?")
+
+# Parts of a path that identify a particular thing rather than a route.
+ROUTE_PATTERNS = [
+    (re.compile(r"^/assets/.+$"), "/assets/{asset}"),
+    (re.compile(r"sha256:[0-9a-f]{64}"), "{hash}"),
+    (re.compile(r"[0-9]{8}-[0-9]{6}-[0-9a-f]{8}"), "{id}"),
+    (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"), "{uuid}"),
+    (re.compile(r"(?<=/)[0-9a-f]{32,}(?=/|$)"), "{hash}"),
+    (re.compile(r"(?<=/)[0-9]+(?=/|$)"), "{n}"),
+]
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class LatencyStats:
+    instance: str
+    route: Optional[str]
+    count: int
+    rate: float
+    p50: float
+    p95: float
+    p99: float
+
+
+@dataclass
+class LogStats:
+    start: Optional[dt.datetime]
+    end: Optional[dt.datetime]
+    instances: list[LatencyStats]
+    routes: list[LatencyStats]
+    # Lines that could not be parsed, e.g. from an older log format
+    skipped: int = 0
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "start": self.start.isoformat() if self.start else None,
+            "end": self.end.isoformat() if self.end else None,
+            "instances": [asdict(x) for x in self.instances],
+            "routes": [asdict(x) for x in self.routes],
+            "skipped": self.skipped,
+        }
+
+    def format(self) -> str:
+        if self.start is None or self.end is None:
+            return "No requests found"
+        total = sum(x.count for x in self.instances)
+        lines = [f"{total} requests from {self.start.isoformat()} to {self.end.isoformat()}"]
+        if self.skipped:
+            lines.append(f"(skipped {self.skipped} unrecognised lines)")
+        percentiles = " ".join(f"{f'p{p} (ms)':>9}" for p in PERCENTILES)
+        lines += ["", f"{'Instance':<16} {'Route':<48} {'Count':>8} {'Req/s':>8} {percentiles}"]
+        for instance in self.instances:
+            rows = [instance] + [x for x in self.routes if x.instance == instance.instance]
+            for x in rows:
+                route = x.route or "(all)"
+                lines.append(
+                    f"{x.instance:<16} {route:<48} {x.count:>8} {x.rate:>8.2f} "
+                    f"{x.p50 * 1000:>9.1f} {x.p95 * 1000:>9.1f} {x.p99 * 1000:>9.1f}"
+                )
+        return "\n".join(lines)
+
+
+def log_stats(
+    entries: Iterable[dict[str, Any]],
+    hostnames: Mapping[str, str],
+    *,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+) -> LogStats:
+    """
+    Summarise the request latency (nginx's `request_time`) and throughput of
+    each instance, and each route within it, between `since` and `until`.
+
+    `hostnames` maps server names to instance names; requests for other
+    servers are reported under the server name. Throughput is averaged over
+    the window if given, and otherwise over the time covered by the log.
+    """
+    times: dict[tuple[str, Optional[str]], list[float]] = {}
+    start = end = None
+    skipped = 0
+    for entry in entries:
+        try:
+            time = dt.datetime.fromisoformat(entry["time"])
+            request_time = float(entry["request_time"])
+            key = (hostnames.get(entry["host"], entry["host"]), route(entry["method"], entry["uri"]))
+        except (KeyError, TypeError, ValueError):
+            skipped += 1
+            continue
+        if (since is not None and time < since) or (until is not None and time > until):
+            continue
+        start = time if start is None else min(start, time)
+        end = time if end is None else max(end, time)
+        times.setdefault(key, []).append(request_time)
+        times.setdefault((key[0], None), []).append(request_time)
+
+    if start is None or end is None:
+        return LogStats(None, None, [], [], skipped)
+    window = ((until or end) - (since or start)).total_seconds()
+    stats = [_latency_stats(k[0], k[1], v, window) for k, v in times.items()]
+    stats.sort(key=lambda x: (x.instance, -x.count))
+    return LogStats(
+        start=since or start,
+        end=until or end,
+        instances=[x for x in stats if x.route is None],
+        routes=[x for x in stats if x.route is not None],
+        skipped=skipped,
+    )
+
+
+def route(method: str, uri: str) -> str:
+    """
+    Describe the route a request was for, e.g. `GET /api/packets/{id}`.
+    """
+    path = uri.split("?", 1)[0]
+    for pattern, replacement in ROUTE_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return f"{method} {path}"
+
+
+def percentile(values: list[float], p: float) -> float:
+    # Nearest rank; `values` must be sorted
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _latency_stats(instance: str, route: Optional[str], values: list[float], window: float) -> LatencyStats:
+    values.sort()
+    p50, p95, p99 = (percentile(values, p) for p in PERCENTILES)
+    rate = len(values) / window if window > 0 else float(len(values))
+    return LatencyStats(instance, route, len(values), round(rate, 3), p50, p95, p99)
+
+
+def parse_entries(lines: Iterable[bytes]) -> Iterator[dict[str, Any]]:
+    """
+    Parse access log lines; lines that are not JSON are yielded as empty
+    entries so that they are counted as skipped.
+    """
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            entry = {}
+        yield entry if isinstance(entry, dict) else {}
+
+
+def read_access_logs(archive: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Read the lines of every access log in a tar archive of the log directory,
+    as returned in chunks by docker's `get_archive`.
+
+    The archive is read as a stream, one member at a time, and compressed
+    logs are decompressed as they are read, so no log is held in memory.
+    """
+    with tarfile.open(fileobj=io.BufferedReader(_ChunkReader(archive)), mode="r|") as tar:
+        for member in tar:
+            name = member.name.rsplit("/", 1)[-1]
+            if not member.isfile() or not ACCESS_LOG_PATTERN.fullmatch(name):
+                continue
+            f = tar.extractfile(member)
+            if f is None:  # pragma: no cover
+                continue
+            lines: Iterable[bytes] = gzip.GzipFile(fileobj=f) if name.endswith(".gz") else f
+            yield from lines
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    A file-like view of an iterator of byte strings.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
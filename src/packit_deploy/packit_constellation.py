@@ -1,62 +1,137 @@
+import datetime as dt
+import functools
+import hashlib
 import re
-from typing import Optional
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlsplit
 
 import constellation
+import docker
 import jinja2
 from constellation import ConstellationContainer, acme, docker_util, vault
+from jinja2.bccache import Bucket
 
-from packit_deploy import config
+from packit_deploy import config, fingerprint, images, logs, readiness, tracing
+from packit_deploy.cache import cache_dir, write_atomically
 from packit_deploy.config import PackitConfig
-from packit_deploy.docker_helpers import write_to_container
+from packit_deploy.docker_helpers import patch_files, write_to_container
+from packit_deploy.logs import LogStats
+from packit_deploy.scheduler import run_graph
+from packit_deploy.status import ConstellationStatus, collect_status
+from packit_deploy.vault_secrets import CachingVaultClient, SecretCache
 
+
+class TemplateCache(jinja2.BytecodeCache):
+    """
+    Keeps compiled templates in packit-deploy's cache directory, so that each
+    template is compiled once rather than on every run.
+
+    Jinja checks each entry against the template's source, so stale entries
+    are simply recompiled. Failing to read or write the cache is not an error.
+    """
+
+    def load_bytecode(self, bucket: Bucket) -> None:
+        try:
+            with self._path(bucket).open("rb") as f:
+                bucket.load_bytecode(f)
+        except OSError:
+            pass
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        try:
+            write_atomically(self._path(bucket), bucket.bytecode_to_string())
+        except OSError:
+            pass
+
+    def _path(self, bucket: Bucket) -> Path:
+        return cache_dir() / "templates" / f"{bucket.key}.cache"
+
+
+TEMPLATE_LOADER = jinja2.PackageLoader("packit_deploy")
 JINJA_ENVIRONMENT = jinja2.Environment(
-    loader=jinja2.PackageLoader("packit_deploy"),
+    loader=TEMPLATE_LOADER,
     undefined=jinja2.StrictUndefined,
     autoescape=False,  # noqa: S701, we only template from config values, not user inputs
+    bytecode_cache=TemplateCache(),
 )
 
+# Where the proxy keeps a digest of the configuration files it was last given,
+# so that unchanged configuration is never rewritten.
+PROXY_CONFIG_HASH_PATH = "/etc/nginx/packit-config.sha256"
 
-class PackitConstellation:
-    def __init__(self, cfg: PackitConfig):
-        # resolve secrets early so we can set these env vars from vault values
-        if cfg.vault and cfg.vault.url:
-            vault.resolve_secrets(cfg, cfg.vault.client())
-
-            if cfg.acme_config is not None:  # pragma: no cover
-                vault.resolve_secrets(cfg.acme_config, cfg.vault.client())
 
-            for instance in cfg.instances.values():
-                vault.resolve_secrets(instance, cfg.vault.client())
+class PackitConstellation:
+    def __init__(self, cfg: PackitConfig, *, resolve_secrets: bool = True):
+        # resolve secrets early so we can set these env vars from vault values.
+        # Commands that never create containers (status, stop) can skip this,
+        # and then the environment just contains the unresolved references.
+        if resolve_secrets and cfg.vault and cfg.vault.url:
+            with tracing.span("vault"):
+                # A single client, shared by everything, so that we
+                # authenticate once and read each secret path once.
+                client = CachingVaultClient(cfg.vault, SecretCache.from_environment(cfg.vault.url))
+                vault.resolve_secrets(cfg, client)
+
+                if cfg.acme_config is not None:  # pragma: no cover
+                    vault.resolve_secrets(cfg.acme_config, client)
+
+                for instance in cfg.instances.values():
+                    vault.resolve_secrets(instance, client)
+                client.save()
 
         containers = []
-        for instance in cfg.instances.values():
+        # Maps each container name to the names of the containers that must be
+        # started (and configured) before it. Only used by parallel starts;
+        # a sequential start just follows the order of `containers`.
+        dependencies: dict[str, list[str]] = {}
+        # Describes what each container's configure hooks write into it, for
+        # containers where that isn't already captured by its fingerprint.
+        payloads: dict[str, Callable[[], object]] = {}
+        # Maps each per-instance container name to its instance's name.
+        instances: dict[str, Optional[str]] = {}
+        for name, instance in cfg.instances.items():
             containers.append(outpack_server_container(instance))
             containers.append(packit_db_container(instance))
             containers.append(packit_api_container(instance, cfg.orderly_runner))
             containers.append(packit_container(instance))
+            payloads[instance.packit_app.container_name] = functools.partial(packit_payload, instance)
+            dependencies[instance.packit_api.container_name] = [instance.packit_db.container_name]
+            for x in (instance.outpack_server, instance.packit_db, instance.packit_api, instance.packit_app):
+                instances[x.container_name] = name
 
         if cfg.proxy is not None:
             proxy = proxy_container(cfg.proxy, cfg)
             containers.append(proxy)
+            # The proxy does not depend on any backend: nginx looks up their
+            # addresses as it runs, so they can come and go independently.
+            # The proxy's configuration files are deliberately not part of its
+            # fingerprint: `apply` updates them in place instead.
             if cfg.acme_config is not None:
-                hostnames = [cfg.proxy.hostname] + [
-                    instance_hostname(name, cfg.proxy.hostname) for name in cfg.instances.keys() if name is not None
-                ]
                 acme_container = acme.acme_buddy_container(
                     cfg.acme_config,
                     "acme-buddy",
                     proxy.name_external(cfg.container_prefix),
                     "packit-tls",
-                    ",".join(hostnames),
+                    ",".join(proxy_hostnames(cfg, cfg.proxy)),
                 )
                 containers.append(acme_container)
+                dependencies[acme_container.name] = [proxy.name]
 
         if cfg.orderly_runner is not None:
-            containers.append(redis_container(cfg.orderly_runner))
+            redis = redis_container(cfg.orderly_runner)
+            containers.append(redis)
             containers.append(orderly_runner_api_container(cfg.orderly_runner))
             containers.append(orderly_runner_worker_containers(cfg.orderly_runner))
+            dependencies[cfg.orderly_runner.api.container_name] = [redis.name]
+            dependencies[cfg.orderly_runner.worker.container_name] = [redis.name]
 
         self.cfg = cfg
+        self.dependencies = dependencies
+        self.payloads = payloads
+        self.instances = instances
         self.obj = constellation.Constellation(
             "packit",
             cfg.container_prefix,
@@ -67,14 +142,217 @@ class PackitConstellation:
             vault_config=cfg.vault,
         )
 
-    def start(self, **kwargs):
-        self.obj.start(**kwargs)
+    def start(self, *, pull_images: bool = False, parallel: Optional[int] = None):
+        """
+        Start the constellation.
+
+        With `parallel`, containers are started as soon as the containers they
+        depend on (see `self.dependencies`) are up and configured, with at most
+        `parallel` containers being started at once. Otherwise containers are
+        started one after another.
+        """
+        obj = self.obj
+        if any(obj.containers.exists(obj.prefix)):
+            msg = "Some containers exist"
+            raise Exception(msg)
 
-    def stop(self, **kwargs):
-        self.obj.stop(**kwargs)
+        self._prepare(pull_images=pull_images)
+        if parallel is None:
+            for x in obj.containers.collection:
+                self._start_container(x)
+        else:
+            tasks = {x.name: functools.partial(self._start_container, x) for x in obj.containers.collection}
+            run_graph(tasks, self.dependencies, max_workers=parallel)
+
+    def apply(self, *, pull_images: bool = False):
+        """
+        Bring the running constellation in line with the configuration.
+
+        Only containers that are missing, not running, or whose fingerprint
+        differs from the one they were created with are (re)created, and
+        containers that are no longer part of the configuration are removed
+        (leaving their volumes); everything else is left untouched.
+        """
+        obj = self.obj
+        fingerprints = self._prepare(pull_images=pull_images)
+        recreated = set()
+        for x in obj.containers.collection:
+            if fingerprint.is_current(x, obj.prefix, fingerprints[x.name]):
+                print(f"{x.name} is up to date")
+                continue
+            print(f"Recreating {x.name}")
+            with tracing.span("stop", **self._span_args(x)):
+                x.stop(obj.prefix)
+                x.remove(obj.prefix)
+            self._start_container(x)
+            recreated.add(x.name)
+
+        # Containers left over from parts of the configuration that have gone,
+        # e.g. a removed instance. Their volumes are kept.
+        for container in fingerprint.orphaned_containers(docker.client.from_env(), obj):
+            print(f"Removing {container.name}, which is no longer in the configuration")
+            with tracing.span("stop", container=container.name):
+                container.stop()
+                container.remove()
+
+        proxy = self.cfg.proxy
+        if proxy is not None and proxy.container_name not in recreated:
+            container = obj.containers.get(proxy.container_name, obj.prefix)
+            self.reload_proxy(container)
+
+        print(f"Recreated {len(recreated)} of {len(obj.containers.collection)} containers")
+
+    def reload_proxy(self, container=None) -> bool:
+        """
+        Bring the running proxy's configuration up to date, without dropping
+        any connections.
+
+        The configuration is rendered from the current `PackitConfig`, and is
+        only written into the proxy if it differs from what the proxy has.
+        Returns whether the proxy was reloaded.
+        """
+        proxy = self.cfg.proxy
+        if proxy is None:
+            msg = "This configuration does not use a proxy"
+            raise Exception(msg)
+        if container is None:
+            container = self.obj.containers.get(proxy.container_name, self.obj.prefix)
+            if container is None or container.status != "running":
+                msg = "The proxy is not running; use 'packit start' or 'packit apply' to start it"
+                raise Exception(msg)
+
+        files = proxy_render(self.cfg, proxy)
+        if read_proxy_config_hash(container) == proxy_config_hash(files):
+            print("[proxy] Configuration is unchanged")
+            return False
+        # A new instance brings a new hostname, which a self-signed
+        # certificate must cover before nginx starts serving it.
+        proxy_self_signed_certificate(container, self.cfg)
+        print("[proxy] Updating proxy configuration")
+        update_proxy_config(container, files)
+        return True
+
+    def proxy_log_stats(self, *, since: Optional[dt.datetime] = None) -> LogStats:
+        """
+        Summarise the latency and throughput of the requests in the proxy's
+        access logs, which are streamed out of the proxy container.
+        """
+        proxy = self.cfg.proxy
+        if proxy is None:
+            msg = "This configuration does not use a proxy"
+            raise Exception(msg)
+        container = self.obj.containers.get(proxy.container_name, self.obj.prefix)
+        if container is None:
+            msg = "The proxy container does not exist"
+            raise Exception(msg)
 
-    def status(self):
-        self.obj.status()
+        hostnames = {instance_hostname(name, proxy.hostname): name or "packit" for name in self.cfg.instances}
+        archive, _stat = container.get_archive(logs.LOG_DIR)
+        return logs.log_stats(logs.parse_entries(logs.read_access_logs(archive)), hostnames, since=since)
+
+    def pull(self):
+        images.pull_images(images.image_references(self.cfg), cache=images.ManifestCache.default())
+
+    def _prepare(self, *, pull_images: bool) -> dict[str, str]:
+        """
+        Get everything ready for containers to be created.
+
+        Secrets have already been resolved in the constructor. This prepares
+        images (pulling each distinct image once, if requested), labels every
+        container with its fingerprint and creates the network and volumes.
+        Returns the fingerprint of each container.
+        """
+        obj = self.obj
+        if pull_images:
+            with tracing.span("pull-all"):
+                self.pull()
+        with tracing.span("prepare-images"):
+            obj.containers.prepare_images(pull=False)
+
+        client = docker.client.from_env()
+        fingerprints = {}
+        for x in obj.containers.collection:
+            payload = self.payloads[x.name]() if x.name in self.payloads else None
+            image_id = fingerprint.resolve_image_id(client, x)
+            fingerprints[x.name] = fingerprint.container_fingerprint(x, image_id, obj.volumes, payload)
+            fingerprint.set_fingerprint(x, fingerprints[x.name])
+
+        obj.network.create()
+        obj.volumes.create()
+        return fingerprints
+
+    def _span_args(self, x) -> dict[str, Any]:
+        # Containers belonging to an instance are traced with its name (None
+        # for the single unnamed instance); shared containers have none.
+        args: dict[str, Any] = {"container": x.name}
+        if x.name in self.instances:
+            args["instance"] = self.instances[x.name]
+        return args
+
+    def _start_container(self, x):
+        obj = self.obj
+        args = self._span_args(x)
+        tracer = tracing.active()
+        if tracer is None or not isinstance(x, ConstellationContainer):
+            with tracing.span("container", **args):
+                x.start(obj.prefix, obj.network, obj.volumes, obj.data)
+            return
+
+        # Constellation creates the container, runs the preconfigure hook,
+        # starts the container and then runs the configure hook. Wrapping the
+        # hooks lets us split the time between those four phases.
+        preconfigure = x.preconfigure
+        configure = x.configure
+        times = {"create": time.perf_counter()}
+
+        def traced_preconfigure(container, data):
+            tracer.record("create", times["create"], time.perf_counter(), **args)
+            if preconfigure:
+                with tracer.span("preconfigure", **args):
+                    preconfigure(container, data)
+            times["start"] = time.perf_counter()
+
+        def traced_configure(container, data):
+            tracer.record("start", times["start"], time.perf_counter(), **args)
+            if configure:
+                with tracer.span("configure", **args):
+                    configure(container, data)
+
+        x.preconfigure = traced_preconfigure
+        x.configure = traced_configure
+        try:
+            with tracer.span("container", **args):
+                x.start(obj.prefix, obj.network, obj.volumes, obj.data)
+        finally:
+            x.preconfigure = preconfigure
+            x.configure = configure
+
+    def stop(self, *, kill: bool = False, remove_network: bool = False, remove_volumes: bool = False):
+        obj = self.obj
+        for x in obj.containers.collection:
+            with tracing.span("stop", **self._span_args(x)):
+                x.stop(obj.prefix, kill)
+                x.remove(obj.prefix)
+        if remove_network:
+            obj.network.remove()
+        if remove_volumes:
+            obj.volumes.remove()
+
+    def status(self, *, detail: bool = False) -> ConstellationStatus:
+        """
+        Get the state of the network, volumes and every container.
+
+        With `detail`, also find each container's restart count and uptime.
+        """
+        client = docker.client.from_env()
+        return collect_status(client, self.obj, self.instances, detail=detail)
+
+
+def proxy_hostnames(cfg: PackitConfig, proxy: config.Proxy) -> list[str]:
+    """
+    List every hostname that the proxy serves, and so needs a certificate for.
+    """
+    return [proxy.hostname] + [instance_hostname(name, proxy.hostname) for name in cfg.instances if name is not None]
 
 
 def instance_hostname(name: Optional[str], toplevel: str):
@@ -87,7 +365,8 @@ def instance_hostname(name: Optional[str], toplevel: str):
 def outpack_server_container(instance: config.PackitInstance) -> ConstellationContainer:
     name = instance.outpack_server.container_name
     mounts = [constellation.ConstellationVolumeMount(instance.volume_id_outpack, "/outpack")]
-    return ConstellationContainer(name, instance.outpack_server.image, mounts=mounts)
+    configure = functools.partial(wait_for_health, timeout=instance.outpack_server.startup_timeout)
+    return ConstellationContainer(name, instance.outpack_server.image, mounts=mounts, configure=configure)
 
 
 def packit_db_container(instance: config.PackitInstance) -> ConstellationContainer:
@@ -109,7 +388,10 @@ def packit_db_container(instance: config.PackitInstance) -> ConstellationContain
 
 def packit_db_configure(container, _cfg: PackitConfig):
     print("[packit-db] Configuring DB container")
-    docker_util.exec_safely(container, ["wait-for-db"])
+    # Probe over TCP rather than the unix socket: while the image is running
+    # its init scripts postgres only listens on the socket.
+    probe = readiness.exec_probe(["pg_isready", "--quiet", "--host", "127.0.0.1", "--port", "5432"])
+    readiness.wait_until_ready(container, probe, name=container.name)
 
 
 def packit_api_container(
@@ -120,6 +402,7 @@ def packit_api_container(
         name,
         instance.packit_api.image,
         environment=packit_api_get_env(instance, runner),
+        configure=functools.partial(wait_for_health, timeout=instance.packit_api.startup_timeout),
     )
 
 
@@ -206,69 +489,85 @@ def packit_container(instance: config.PackitInstance):
 
 def packit_configure(container, _cfg: PackitConfig, instance: config.PackitInstance):
     print("[instance] Configuring Packit container")
-    if instance.brand.name is not None:
-        # We configure the title tag of the index.html file here, rather than updating it dynamically with JS,
-        # since using JS results in the page title visibly changing a number of seconds after the initial page load.
-        substitute_file_content(
-            container, f"{config.APP_HTML_ROOT}/index.html", r"(?<=<title>).*?(?=</title>)", instance.brand.name
-        )
-    if instance.brand.favicon is not None:
-        substitute_file_content(
-            container, f"{config.APP_HTML_ROOT}/index.html", r"favicon\.ico", instance.brand.favicon.name
-        )
+    patch_files(container, packit_file_edits(instance))
+
+
+def packit_file_edits(instance: config.PackitInstance) -> dict[str, Callable[[str], str]]:
+    brand = instance.brand
 
-    new_css = ""
+    def edit_index(content: str) -> str:
+        if brand.name is not None:
+            # We configure the title tag of the index.html file here, rather than updating it dynamically with JS,
+            # since using JS results in the page title visibly changing a number of seconds after the initial page
+            # load.
+            content = re.sub(r"(?<=<title>).*?(?=</title>)", brand.name, content)
+        if brand.favicon is not None:
+            content = re.sub(r"favicon\.ico", brand.favicon.name, content)
+        return content
+
+    css = packit_custom_css(instance)
+    edits = {f"{config.APP_HTML_ROOT}/css/custom.css": lambda _: css}
+    if brand.name is not None or brand.favicon is not None:
+        edits[f"{config.APP_HTML_ROOT}/index.html"] = edit_index
+    return edits
+
+
+def packit_custom_css(instance: config.PackitInstance) -> str:
+    css = ""
     if instance.brand.theme_light is not None:
-        new_css += (
+        css += (
             ":root {\n"
             f"  --custom-accent: {instance.brand.theme_light.accent};\n"
             f"  --custom-accent-foreground: {instance.brand.theme_light.foreground};\n"
             "}\n"
         )
     if instance.brand.theme_dark is not None:
-        new_css += (
+        css += (
             ".dark {\n"
             f"  --custom-accent: {instance.brand.theme_dark.accent};\n"
             f"  --custom-accent-foreground: {instance.brand.theme_dark.foreground};\n"
             "}\n"
         )
-    overwrite_file(container, f"{config.APP_HTML_ROOT}/css/custom.css", new_css)
-
-
-def overwrite_file(container, path, content):
-    substitute_file_content(container, path, r".*", content, flags=re.DOTALL)
-
+    return css
 
-def substitute_file_content(container, path, pattern, replacement, flags=0):
-    prev_file_content = docker_util.string_from_container(container, path)
-    new_content = re.sub(pattern, replacement, prev_file_content, flags=flags)
 
-    backup = f"{path}.bak"
-    docker_util.exec_safely(container, ["mv", path, backup])
-
-    docker_util.string_into_container(new_content, container, path)
-
-    # Clone permissions from the original file's backup to the new one
-    docker_util.exec_safely(container, ["chown", "--reference", backup, path])
-    docker_util.exec_safely(container, ["chmod", "--reference", backup, path])
-
-    # Remove the backup file
-    docker_util.exec_safely(container, ["rm", backup])
+def packit_payload(instance: config.PackitInstance):
+    return {
+        "title": instance.brand.name,
+        "favicon": instance.brand.favicon.name if instance.brand.favicon is not None else None,
+        "css": packit_custom_css(instance),
+    }
 
 
 def proxy_container(proxy: config.Proxy, cfg: PackitConfig):
     name = proxy.container_name
-    mounts = [constellation.ConstellationVolumeMount("proxy_logs", "/var/log/nginx")]
-    if cfg.acme_config is not None:
-        mounts.append(constellation.ConstellationVolumeMount("packit-tls", "/run/proxy"))
+    mounts = [
+        constellation.ConstellationVolumeMount("proxy_logs", "/var/log/nginx"),
+        constellation.ConstellationVolumeMount("packit-tls", "/run/proxy"),
+    ]
+    if proxy.cache is not None:
+        mounts.append(constellation.ConstellationVolumeMount("proxy_cache", proxy.cache.path))
+    if proxy.serve_outpack_files:
+        for instance_name, instance in cfg.instances.items():
+            target = proxy_outpack_root(instance_name)
+            mounts.append(constellation.ConstellationVolumeMount(instance.volume_id_outpack, target, read_only=True))
     ports = [proxy.port_http, proxy.port_https]
     if proxy.port_metrics is not None:
         ports.append(proxy.port_metrics)
+    environment = {
+        # The proxy rotates its JSON access log once it reaches this size
+        "PACKIT_ACCESS_LOG_MAX_SIZE": str(config.size_bytes(proxy.access_log.max_size)),
+        "PACKIT_ACCESS_LOG_KEEP": str(proxy.access_log.keep),
+    }
+    if proxy.tls is not None and proxy.tls.session_tickets:
+        # The proxy generates the session ticket keys, and rotates them this often
+        environment["PACKIT_TICKET_KEY_ROTATION"] = str(config.duration_seconds(proxy.tls.ticket_key_rotation))
     return ConstellationContainer(
         name,
         image=proxy.image,
         ports=ports,
         mounts=mounts,
+        environment=environment,
         preconfigure=lambda container, cfg: proxy_preconfigure(container, cfg, proxy),
         configure=proxy_configure,
     )
@@ -276,41 +575,208 @@ def proxy_container(proxy: config.Proxy, cfg: PackitConfig):
 
 def proxy_preconfigure(container: ConstellationContainer, cfg: PackitConfig, proxy: config.Proxy):
     print("[proxy] Preconfiguring proxy container")
-
+    write_proxy_config(container, proxy_render(cfg, proxy))
+
+
+def write_proxy_config(container, files: dict[str, str]):
+    for path, content in files.items():
+        write_to_container(content.encode("utf-8"), container, path)
+    write_to_container(proxy_config_hash(files).encode("utf-8"), container, PROXY_CONFIG_HASH_PATH)
+
+
+def update_proxy_config(container, files: dict[str, str]):
+    """
+    Replace the configuration of a running proxy, and reload it gracefully.
+
+    The new configuration is checked with `nginx -t` before nginx is told to
+    reload, at which point it starts new workers and lets the old ones finish
+    their requests. If the check fails the previous files are put back, so the
+    proxy is left as it was.
+    """
+    paths = [*files, PROXY_CONFIG_HASH_PATH]
+    previous = {path: _read_from_container(container, path) for path in paths}
+    write_proxy_config(container, files)
+
+    result = container.exec_run(["nginx", "-t"])
+    if result.exit_code != 0:
+        for path, content in previous.items():
+            if content is not None:
+                write_to_container(content.encode("utf-8"), container, path)
+        missing = [path for path, content in previous.items() if content is None]
+        if missing:
+            docker_util.exec_safely(container, ["rm", "-f", *missing])
+        output = result.output.decode("utf-8", errors="replace").strip()
+        msg = f"New proxy configuration is invalid, keeping the previous one:\n{output}"
+        raise Exception(msg)
+
+    docker_util.exec_safely(container, ["nginx", "-s", "reload"])
+    print("[proxy] Reloaded proxy")
+
+
+def read_proxy_config_hash(container) -> Optional[str]:
+    content = _read_from_container(container, PROXY_CONFIG_HASH_PATH)
+    return content.strip() if content is not None else None
+
+
+def _read_from_container(container, path: str) -> Optional[str]:
+    try:
+        return docker_util.string_from_container(container, path)
+    except docker.errors.NotFound:
+        return None
+
+
+def proxy_config_hash(files: dict[str, str]) -> str:
+    """
+    Compute a digest of a set of rendered configuration files.
+    """
+    h = hashlib.sha256()
+    for path, content in sorted(files.items()):
+        h.update(f"{path}\0{content}\0".encode())
+    return h.hexdigest()
+
+
+def proxy_render(cfg: PackitConfig, proxy: config.Proxy) -> dict[str, str]:
+    """
+    Render the proxy's configuration files, keyed by their path in the container.
+    """
+    start = time.perf_counter()
+    with tracing.span("render"):
+        files = _proxy_render(cfg, proxy)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"[proxy] Rendered configuration for {len(cfg.instances)} instance(s) in {elapsed:.1f}ms")
+    return files
+
+
+def _proxy_render(cfg: PackitConfig, proxy: config.Proxy) -> dict[str, str]:
+    files = {}
     instances = [
         {
             "hostname": instance_hostname(name, proxy.hostname),
             "outpack_server_url": instance.outpack_server_url,
             "packit_app_url": instance.packit_app_url,
             "packit_api_url": instance.packit_api_url,
-            "packit_api_management_url": instance.packit_api_management_url,
             "name": instance.brand.name or name,
+            "outpack_root": proxy_outpack_root(name),
+            "client_max_body_size": instance.client_max_body_size,
+            "limits": proxy_limits(name, instance),
+            "upstreams": {
+                "outpack_server": proxy_upstream(instance.outpack_server.container_name, instance.outpack_server_url),
+                "packit_app": proxy_upstream(instance.packit_app.container_name, instance.packit_app_url),
+                "packit_api": proxy_upstream(instance.packit_api.container_name, instance.packit_api_url),
+                "packit_api_management": proxy_upstream(
+                    f"{instance.packit_api.container_name}-management", instance.packit_api_management_url
+                ),
+            },
         }
         for name, instance in cfg.instances.items()
     ]
 
     if None not in instances:
         index = JINJA_ENVIRONMENT.get_template("index.html.j2").render(instances=instances)
-        write_to_container(index.encode("utf-8"), container, "/usr/share/nginx/html/index.html")
+        files["/usr/share/nginx/html/index.html"] = index
         index_hostname = proxy.hostname
     else:
         index_hostname = None
 
-    nginx_conf = JINJA_ENVIRONMENT.get_template("nginx.conf.j2").render(
+    # njs is only needed to count responses for the metrics server.
+    limits = any(x["limits"] for x in instances)
+    njs = proxy.cache is not None or limits
+    files["/etc/nginx/conf.d/default.conf"] = JINJA_ENVIRONMENT.get_template("nginx.conf.j2").render(
         instances=instances,
         port_http=proxy.port_http,
         port_https=proxy.port_https,
         port_metrics=proxy.port_metrics,
         index_hostname=index_hostname,
+        upstream=proxy.upstream,
+        cache=proxy.cache,
+        serve_outpack_files=proxy.serve_outpack_files,
+        compression=proxy.compression,
+        microcache=proxy.microcache,
+        tls=proxy.tls,
+        upload_request_buffering=proxy.tuning.upload_request_buffering,
+        ocsp_stapling=proxy.tls is not None and proxy.tls.ocsp_stapling and cfg.acme_config is not None,
+        limits=limits,
+        njs=njs,
     )
-    write_to_container(nginx_conf.encode("utf-8"), container, "/etc/nginx/conf.d/default.conf")
+    files["/etc/nginx/nginx.conf"] = JINJA_ENVIRONMENT.get_template("nginx-main.conf.j2").render(
+        njs=njs, tuning=proxy.tuning
+    )
+    if njs:
+        files["/etc/nginx/packit_metrics.js"] = _template_source("metrics.js")
+    return files
+
+
+def _template_source(name: str) -> str:
+    # For files that are shipped with the templates but are not templates.
+    source, _filename, _uptodate = TEMPLATE_LOADER.get_source(JINJA_ENVIRONMENT, name)
+    return source
+
+
+def proxy_limits(name: Optional[str], instance: config.PackitInstance) -> dict[str, dict[str, object]]:
+    """
+    Describe the nginx zones through which requests to each part of an
+    instance are limited.
+
+    Limits for all clients share a single key (the server name), so need
+    little space; per-client limits need room for each client's address.
+    """
+    ret: dict[str, dict[str, object]] = {}
+    for scope, limit in instance.limits.items():
+        ret[scope] = {
+            "zone": re.sub(r"[^0-9A-Za-z_]", "_", f"packit_{name or 'default'}_{scope}"),
+            "key": "$binary_remote_addr" if limit.per_client else "$server_name",
+            "size": "10m" if limit.per_client else "1m",
+            "rate": limit.rate,
+            "burst": limit.burst,
+            "connections": limit.connections,
+        }
+    return ret
+
+
+def proxy_outpack_root(name: Optional[str]) -> str:
+    """
+    Where an instance's outpack volume is mounted in the proxy, if it serves
+    outpack files itself.
+    """
+    return f"/srv/outpack/{name or 'default'}"
+
+
+def proxy_upstream(container_name: str, url: str) -> dict[str, str]:
+    """
+    Describe the nginx upstream block through which a backend is proxied.
+
+    The upstream is named after the container, so that the backend still sees
+    its own name in the Host header of proxied requests.
+    """
+    return {"name": container_name, "server": urlsplit(url).netloc}
+
+
+def proxy_self_signed_certificate(container, cfg: PackitConfig) -> bool:
+    """
+    Make sure the proxy has a self-signed certificate covering all of its
+    hostnames, unless its certificates come from acme-buddy.
+
+    The certificate is kept on the packit-tls volume, and only regenerated
+    if the hostnames change or it is about to expire. Returns whether a
+    self-signed certificate is used.
+    """
+    if cfg.acme_config is not None or cfg.proxy is None:
+        return False
+    print("[proxy] Preparing self-signed certificate for proxy")
+    hostnames = proxy_hostnames(cfg, cfg.proxy)
+    docker_util.exec_safely(container, ["self-signed-certificate", "--hostnames", "/run/proxy", *hostnames])
+    return True
 
 
 def proxy_configure(container: ConstellationContainer, cfg: PackitConfig):
     print("[proxy] Configuring proxy container")
-    if cfg.acme_config is None:
-        print("[proxy] Generating self-signed certificates for proxy")
-        docker_util.exec_safely(container, ["self-signed-certificate", "/run/proxy"])
+    if proxy_self_signed_certificate(container, cfg):
+        # nginx starts as soon as it finds the certificates, and writes its pid
+        # file once it is up. With acme-buddy the certificates only appear once
+        # acme-buddy itself has started, so we can't wait here.
+        readiness.wait_until_ready(
+            container, readiness.exec_probe(["test", "-s", "/run/nginx.pid"]), name=container.name
+        )
 
 
 def redis_container(runner: config.OrderlyRunner) -> ConstellationContainer:
@@ -325,8 +791,17 @@ def redis_container(runner: config.OrderlyRunner) -> ConstellationContainer:
 
 def redis_configure(container, _cfg: PackitConfig):
     print("[redis] Waiting for redis to come up")
-    write_to_container(WAIT_FOR_REDIS, container, "/wait_for_redis", mode=0o755)
-    docker_util.exec_safely(container, ["/wait_for_redis"])
+    # redis-cli exits successfully on error replies (e.g. while loading), so
+    # look for the actual reply.
+    probe = readiness.exec_probe(["sh", "-c", "redis-cli -p 6379 ping | grep -q PONG"])
+    readiness.wait_until_ready(container, probe, name=container.name, timeout=20)
+
+
+def wait_for_health(container, _cfg: PackitConfig, *, timeout: float):
+    # Nothing else waits on these services being healthy, and they may
+    # legitimately take longer than expected, so a slow start is reported
+    # rather than treated as a failed deploy.
+    readiness.wait_until_ready(container, readiness.health_probe, name=container.name, timeout=timeout, required=False)
 
 
 def orderly_runner_api_container(runner: config.OrderlyRunner):
@@ -377,35 +852,3 @@ def orderly_runner_env(runner: config.OrderlyRunner):
         "ORDERLY_RUNNER_QUEUE_ID": "orderly.runner.queue",
         **runner.env,
     }
-
-
-# Small script to wait for redis to come up
-WAIT_FOR_REDIS = b"""#!/usr/bin/env bash
-wait_for()
-{
-    echo "waiting up to $TIMEOUT seconds for redis"
-    start_ts=$(date +%s)
-    for i in $(seq $TIMEOUT); do
-        redis-cli -p 6379 ping | grep PONG
-        result=$?
-        if [[ $result -eq 0 ]]; then
-            end_ts=$(date +%s)
-            echo "redis is available after $((end_ts - start_ts)) seconds"
-            break
-        fi
-        sleep 1
-        echo "...still waiting"
-    done
-    return $result
-}
-
-# The variable expansion below is 20s by default, or the argument provided
-# to this script
-TIMEOUT="${1:-20}"
-wait_for
-RESULT=$?
-if [[ $RESULT -ne 0 ]]; then
-  echo "redis did not become available in time"
-fi
-exit $RESULT
-"""
@@ -0,0 +1,93 @@
+import time
+from collections.abc import Callable
+from typing import Optional
+
+import docker
+from docker.models.containers import Container
+
+# Default time (in seconds) to wait for a service to come up.
+READY_TIMEOUT = 60
+
+Probe = Callable[[Container], bool]
+
+
+class NotReadyError(Exception):
+    pass
+
+
+def wait_until_ready(
+    container: Container,
+    probe: Probe,
+    *,
+    name: str,
+    timeout: float = READY_TIMEOUT,
+    required: bool = True,
+    initial: float = 0.05,
+    factor: float = 2,
+    max_interval: float = 1,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Optional[float]:
+    """
+    Wait for a container's service to become ready.
+
+    The probe is retried with exponential backoff, starting at `initial`
+    seconds between attempts and growing by `factor` up to `max_interval`, so
+    that fast services are noticed within a few tens of milliseconds while slow
+    ones are not hammered. Returns the time taken, in seconds.
+
+    Raises `NotReadyError` if the container stops while we wait, or if the
+    service is not ready within `timeout` seconds. Services that are not
+    `required` to be ready just carry on starting after the timeout, and
+    None is returned.
+    """
+    start = clock()
+    interval = initial
+    while True:
+        if probe(container):
+            elapsed = clock() - start
+            print(f"[{name}] Ready after {elapsed:.2f}s")
+            return elapsed
+
+        container.reload()
+        if container.status not in ("created", "running"):
+            msg = f"'{name}' stopped ({container.status}) while waiting for it to become ready"
+            raise NotReadyError(msg)
+
+        if clock() - start + interval > timeout:
+            if not required:
+                print(f"[{name}] Still starting after {timeout}s; not waiting for it any longer")
+                return None
+            msg = f"'{name}' was not ready after {timeout}s"
+            raise NotReadyError(msg)
+
+        sleep(interval)
+        interval = min(interval * factor, max_interval)
+
+
+def exec_probe(args: list[str]) -> Probe:
+    """
+    A probe that succeeds when a command run in the container exits successfully.
+    """
+
+    def probe(container: Container) -> bool:
+        try:
+            return container.exec_run(args).exit_code == 0
+        except docker.errors.APIError:
+            # e.g., the container is not running (yet)
+            return False
+
+    return probe
+
+
+def health_probe(container: Container) -> bool:
+    """
+    A probe that uses the image's docker healthcheck, if it has one.
+
+    Containers without a healthcheck are considered ready once running.
+    """
+    container.reload()
+    health = container.attrs["State"].get("Health")
+    if health is not None:
+        return health["Status"] == "healthy"
+    return container.status == "running"
@@ -0,0 +1,79 @@
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Optional
+
+
+def run_graph(
+    tasks: Mapping[str, Callable[[], object]],
+    dependencies: Mapping[str, Iterable[str]],
+    *,
+    max_workers: int,
+) -> None:
+    """
+    Run a collection of tasks, respecting the dependencies between them.
+
+    Each task is started as soon as all of the tasks it depends on have
+    completed, with at most `max_workers` tasks running at any one time. Tasks
+    that are ready at the same time are started in the order they appear in
+    `tasks`.
+
+    If a task fails no further tasks are started; the tasks that are already
+    running are allowed to finish and the first error is then re-raised.
+    """
+    if max_workers < 1:
+        msg = f"'max_workers' must be at least 1, but was {max_workers}"
+        raise Exception(msg)
+
+    remaining = {name: set(dependencies.get(name, ())) for name in tasks}
+    _check_graph(remaining)
+
+    running: dict[Future, str] = {}
+    error: Optional[BaseException] = None
+    with ThreadPoolExecutor(max_workers) as pool:
+        while True:
+            if error is None:
+                for name in [name for name, deps in remaining.items() if not deps]:
+                    if len(running) >= max_workers:
+                        break
+                    del remaining[name]
+                    running[pool.submit(tasks[name])] = name
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    error = error or exc
+                else:
+                    for deps in remaining.values():
+                        deps.discard(name)
+
+    if error is not None:
+        raise error
+
+
+def _check_graph(graph: dict[str, set[str]]) -> None:
+    for name, deps in graph.items():
+        unknown = deps - graph.keys()
+        if unknown:
+            msg = f"Task '{name}' depends on unknown tasks: {', '.join(sorted(unknown))}"
+            raise Exception(msg)
+
+    # Repeatedly strip out tasks with no outstanding dependencies; anything
+    # left over is part of (or depends on) a cycle.
+    pending = {name: set(deps) for name, deps in graph.items()}
+    while True:
+        ready = {name for name, deps in pending.items() if not deps}
+        if not ready:
+            break
+        for name in ready:
+            del pending[name]
+        for deps in pending.values():
+            deps.difference_update(ready)
+
+    if pending:
+        msg = f"Dependency cycle between tasks: {', '.join(sorted(pending))}"
+        raise Exception(msg)
@@ -0,0 +1,149 @@
+import datetime as dt
+import re
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+import docker
+from constellation import Constellation, ConstellationService
+
+# How many containers to inspect at once, for the details (restart count and
+# start time) that docker's container listing does not include.
+INSPECT_WORKERS = 8
+
+
+@dataclass
+class ContainerStatus:
+    name: str
+    container: Optional[str]
+    state: str
+    status: str = ""
+    image_id: Optional[str] = None
+    started_at: Optional[str] = None
+    uptime: Optional[float] = None
+    restart_count: Optional[int] = None
+
+
+@dataclass
+class ConstellationStatus:
+    name: str
+    network: str
+    network_exists: bool
+    volumes: dict[str, tuple[str, bool]]
+    instances: dict[Optional[str], list[ContainerStatus]]
+    shared: list[ContainerStatus] = field(default_factory=list)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "network": {"name": self.network, "exists": self.network_exists},
+            "volumes": [{"role": k, "name": v[0], "exists": v[1]} for k, v in self.volumes.items()],
+            "instances": [{"name": k, "containers": [asdict(x) for x in v]} for k, v in self.instances.items()],
+            "shared": [asdict(x) for x in self.shared],
+        }
+
+    def format(self) -> str:
+        lines = [f"Constellation {self.name}"]
+        lines.append("  * Network:")
+        lines.append(f"    - {self.network}: {_created(exists=self.network_exists)}")
+        lines.append("  * Volumes:")
+        for role, (name, exists) in self.volumes.items():
+            lines.append(f"    - {role} ({name}): {_created(exists=exists)}")
+        groups = [(f"Instance '{k}'" if k else "Containers", v) for k, v in self.instances.items()]
+        if self.shared:
+            groups.append(("Shared", self.shared))
+        for title, containers in groups:
+            lines.append(f"  * {title}:")
+            for x in containers:
+                detail = f" ({x.status})" if x.status else ""
+                lines.append(f"    - {x.name} ({x.container or 'missing'}): {x.state}{detail}")
+        return "\n".join(lines)
+
+
+def collect_status(
+    client: docker.DockerClient,
+    obj: Constellation,
+    instances: Mapping[str, Optional[str]],
+    *,
+    detail: bool = False,
+    clock: Callable[[], dt.datetime] = lambda: dt.datetime.now(dt.timezone.utc),
+) -> ConstellationStatus:
+    """
+    Find the state of every container in a constellation.
+
+    All of the constellation's containers are found with a single request,
+    listing containers by name prefix, and matched up with the configuration
+    in memory. `instances` maps container names to the instance that they
+    belong to; containers not listed there are shared between instances.
+
+    With `detail`, each container found is also inspected (concurrently) to
+    get its restart count and uptime, which the listing does not report.
+    """
+    pattern = f"^/{re.escape(obj.prefix)}-"
+    found = {c["Names"][0].lstrip("/"): c for c in client.api.containers(all=True, filters={"name": pattern})}
+
+    inspected: dict[str, dict[str, Any]] = {}
+    if detail and found:
+        with ThreadPoolExecutor(max_workers=INSPECT_WORKERS) as pool:
+            ids = [c["Id"] for c in found.values()]
+            inspected = dict(zip(ids, pool.map(client.api.inspect_container, ids)))
+
+    now = clock()
+    result = ConstellationStatus(
+        name=obj.name,
+        network=obj.network.name,
+        network_exists=bool(client.api.networks(names=[obj.network.name])),
+        volumes={},
+        instances={k: [] for k in dict.fromkeys(instances.values())},
+    )
+    existing_volumes = {v["Name"] for v in client.api.volumes().get("Volumes") or []}
+    for volume in obj.volumes.collection:
+        result.volumes[volume.role] = (volume.name, volume.name in existing_volumes)
+
+    for x in obj.containers.collection:
+        if isinstance(x, ConstellationService):
+            # Replicas are named after the service, with a random suffix.
+            replica_prefix = f"{x.base.name_external(obj.prefix)}-"
+            names = sorted(k for k in found if k.startswith(replica_prefix))
+        else:
+            name_external = x.name_external(obj.prefix)
+            names = [name_external] if name_external in found else []
+        statuses = [_container_status(x.name, found[k], inspected.get(found[k]["Id"]), now) for k in names]
+        if not statuses:
+            statuses = [ContainerStatus(x.name, None, "missing")]
+
+        if x.name in instances:
+            result.instances[instances[x.name]] += statuses
+        else:
+            result.shared += statuses
+    return result
+
+
+def _container_status(
+    name: str, listed: dict[str, Any], inspected: Optional[dict[str, Any]], now: dt.datetime
+) -> ContainerStatus:
+    ret = ContainerStatus(
+        name=name,
+        container=listed["Names"][0].lstrip("/"),
+        state=listed["State"],
+        status=listed["Status"],
+        image_id=listed["ImageID"],
+    )
+    if inspected is not None:
+        state = inspected["State"]
+        ret.restart_count = inspected["RestartCount"]
+        if state["Running"]:
+            ret.started_at = state["StartedAt"]
+            ret.uptime = round((now - _parse_timestamp(state["StartedAt"])).total_seconds(), 1)
+    return ret
+
+
+def _parse_timestamp(value: str) -> dt.datetime:
+    # Docker reports times like 2024-05-01T09:30:00.123456789Z; older Pythons
+    # can't parse nanoseconds or the trailing Z, and we only need seconds.
+    return dt.datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=dt.timezone.utc)
+
+
+def _created(*, exists: bool) -> str:
+    return "created" if exists else "missing"
@@ -0,0 +1,63 @@
+// Counts responses for the proxy's metrics server (see nginx.conf.j2).
+//
+// Counters are kept in a shared dictionary, so that they are shared between
+// workers and survive a reload. Keys are "<metric>\t<server name>\t<label>".
+
+const METRICS = {
+    cache: {
+        name: "packit_proxy_cache_requests_total",
+        help: "Requests for cacheable outpack content, by cache status.",
+        label: "status",
+    },
+    limited: {
+        name: "packit_proxy_limited_requests_total",
+        help: "Requests refused by the instance's request or connection limits.",
+        label: "limit",
+    },
+};
+
+function count(r, metric, value) {
+    ngx.shared.packit_metrics.incr(`${metric}\t${r.variables.server_name}\t${value}`, 1, 0);
+}
+
+// Header filter for cached locations. Requests that were refused before
+// reaching the cache (e.g., unauthorised ones) have no cache status. A
+// location has only one header filter, so this counts limits too.
+function cache_status(r) {
+    const status = r.variables.upstream_cache_status;
+    if (status) {
+        count(r, "cache", status);
+    }
+    limited(r);
+}
+
+// Header filter for instances with request limits, counting the requests
+// that the limits refused (as opposed to 429s from the backends).
+function limited(r) {
+    const scope = r.variables.request_uri.startsWith("/api/") ? "api" : "app";
+    if (r.variables.limit_req_status === "REJECTED") {
+        count(r, "limited", `${scope}_requests`);
+    } else if (r.variables.limit_conn_status === "REJECTED") {
+        count(r, "limited", `${scope}_connections`);
+    }
+}
+
+// Content handler for the metrics server, reporting the counters for its
+// server name in Prometheus' text format.
+function report(r) {
+    const dict = ngx.shared.packit_metrics;
+    const lines = [];
+    for (const [metric, info] of Object.entries(METRICS)) {
+        lines.push(`# HELP ${info.name} ${info.help}`, `# TYPE ${info.name} counter`);
+        for (const key of dict.keys()) {
+            const [m, server, value] = key.split("\t");
+            if (m === metric && server === r.variables.server_name) {
+                lines.push(`${info.name}{${info.label}="${value}"} ${dict.get(key)}`);
+            }
+        }
+    }
+    r.headersOut["Content-Type"] = "text/plain; version=0.0.4";
+    r.return(200, lines.join("\n") + "\n");
+}
+
+export default { cache_status, limited, report };
@@ -0,0 +1,142 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Optional
+
+
+class Tracer:
+    """
+    Records timed spans, which can be exported in Chrome's trace event format.
+
+    Spans may be recorded from several threads at once; each thread shows up
+    as a separate track when the trace is loaded into a viewer such as
+    chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self.events: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), **args)
+
+    def record(self, name: str, start: float, end: float, **args: Any) -> None:
+        """
+        Record a span between two `time.perf_counter()` readings.
+        """
+        event = {
+            "name": name,
+            "cat": "packit",
+            "ph": "X",
+            "ts": round(start * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def write(self, path: Path) -> None:
+        """
+        Write the trace to a file: JSON lines if the file name ends in
+        `.jsonl`, otherwise a Chrome trace event JSON document.
+        """
+        events = sorted(self.events, key=lambda x: x["ts"])
+        with path.open("w") as f:
+            if path.suffix == ".jsonl":
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+            else:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self, *, slowest: int = 5) -> str:
+        """
+        Tabulate the time spent in each kind of span, overall and within each
+        instance, and the slowest spans.
+        """
+        totals: dict[str, list[float]] = {}
+        by_instance: dict[tuple[str, str], list[float]] = {}
+        for event in self.events:
+            totals.setdefault(event["name"], []).append(event["dur"] / 1e6)
+            # Spans for containers that belong to an instance say which one;
+            # the single unnamed instance is None.
+            if "instance" in event["args"]:
+                key = (event["args"]["instance"] or "(default)", event["name"])
+                by_instance.setdefault(key, []).append(event["dur"] / 1e6)
+
+        lines = [f"{'Phase':<16} {_HEADER}"]
+        for name, durations in sorted(totals.items(), key=lambda x: -sum(x[1])):
+            lines.append(f"{name:<16} {_row(durations)}")
+
+        if by_instance:
+            lines += ["", f"{'Instance':<16} {'Phase':<16} {_HEADER}"]
+            for (instance, name), durations in sorted(by_instance.items(), key=lambda x: (x[0][0], -sum(x[1]))):
+                lines.append(f"{instance:<16} {name:<16} {_row(durations)}")
+
+        lines += ["", "Slowest:"]
+        for event in sorted(self.events, key=lambda x: -x["dur"])[:slowest]:
+            detail = ", ".join(f"{k}={v}" for k, v in event["args"].items() if v is not None)
+            lines.append(f"  {event['dur'] / 1e6:>8.2f}s  {event['name']} {detail}".rstrip())
+        return "\n".join(lines)
+
+
+_HEADER = f"{'Count':>6} {'Total (s)':>10} {'Mean (s)':>10} {'Max (s)':>10}"
+
+
+def _row(durations: list[float]) -> str:
+    total = sum(durations)
+    return f"{len(durations):>6} {total:>10.2f} {total / len(durations):>10.2f} {max(durations):>10.2f}"
+
+
+# The tracer for the currently running command, if tracing was requested.
+_tracer: Optional[Tracer] = None
+
+
+def active() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, **args: Any) -> contextlib.AbstractContextManager:
+    """
+    Time a block of code, if tracing is enabled; otherwise this does nothing.
+    """
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, **args)
+
+
+@contextlib.contextmanager
+def tracing(path: Optional[str]) -> Iterator[Optional[Tracer]]:
+    """
+    Enable tracing for the duration of a command, writing the trace to `path`.
+
+    The trace (and a summary) is written even if the command fails, since that
+    is often when it is most interesting. If `path` is None, tracing is left
+    disabled.
+    """
+    global _tracer  # noqa: PLW0603
+    if path is None:
+        yield None
+        return
+
+    tracer = Tracer()
+    _tracer = tracer
+    try:
+        with tracer.span("total"):
+            yield tracer
+    finally:
+        _tracer = None
+        tracer.write(Path(path))
+        print(tracer.summary())
+        print(f"Wrote trace to {path}")
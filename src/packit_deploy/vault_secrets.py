@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Optional
+
+from constellation.vault import VaultConfig
+
+from packit_deploy.cache import cache_dir, write_atomically
+
+# How long (in seconds) secrets are kept in the on-disk cache by default.
+SECRET_CACHE_TTL = 60
+
+
+class SecretCache:
+    """
+    A short-lived, encrypted on-disk cache of secrets read from the vault.
+
+    The cache is encrypted with a Fernet key (see `cryptography.fernet`), which
+    is never stored alongside it. Entries are only used for `ttl` seconds after
+    they were read from the vault.
+    """
+
+    def __init__(self, path: Path, key: str, *, ttl: float = SECRET_CACHE_TTL, clock: Callable[[], float] = time.time):
+        try:
+            from cryptography.fernet import Fernet, InvalidToken  # noqa: PLC0415, optional dependency
+        except ImportError:  # pragma: no cover
+            msg = "The vault secret cache requires the 'cryptography' package"
+            raise Exception(msg) from None
+
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._fernet = Fernet(key)
+        try:
+            self._entries = json.loads(self._fernet.decrypt(path.read_bytes()))
+        except (OSError, ValueError, InvalidToken):
+            # Missing, corrupt, or written with a different key
+            self._entries = {}
+
+    @classmethod
+    def from_environment(cls, url: str) -> Optional["SecretCache"]:
+        """
+        Create the secret cache for a vault server, if enabled.
+
+        The cache is enabled by setting `PACKIT_VAULT_CACHE_KEY` to a Fernet
+        key, and `PACKIT_VAULT_CACHE_TTL` optionally overrides how long secrets
+        are cached for.
+        """
+        key = os.environ.get("PACKIT_VAULT_CACHE_KEY")
+        if not key:
+            return None
+        value = os.environ.get("PACKIT_VAULT_CACHE_TTL", str(SECRET_CACHE_TTL))
+        try:
+            ttl = float(value)
+        except ValueError:
+            msg = f"Invalid PACKIT_VAULT_CACHE_TTL '{value}', expected a number of seconds"
+            raise ValueError(msg) from None
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        return cls(cache_dir() / f"secrets-{name}", key, ttl=ttl)
+
+    def get(self, path: str) -> Optional[dict[str, Any]]:
+        entry = self._entries.get(path)
+        if entry is None or self._clock() - entry["time"] > self.ttl:
+            return None
+        return entry["data"]
+
+    def set(self, path: str, data: dict[str, Any]) -> None:
+        self._entries[path] = {"data": data, "time": self._clock()}
+
+    def save(self) -> None:
+        """
+        Write the cache back to disk. Failing to do so is not an error; the
+        secrets are just read from the vault again next time.
+        """
+        now = self._clock()
+        entries = {k: v for k, v in self._entries.items() if now - v["time"] <= self.ttl}
+        try:
+            write_atomically(self.path, self._fernet.encrypt(json.dumps(entries).encode("utf-8")))
+        except OSError as e:
+            print(f"Could not save the vault secret cache to {self.path}: {e}")
+
+
+class CachingVaultClient:
+    """
+    A vault client that authenticates at most once and reads each path at most once.
+
+    This implements just enough of the `hvac.Client` interface to be passed to
+    `constellation.vault.resolve_secrets`, so that a whole configuration can be
+    resolved while sharing secret paths between instances. Authentication is
+    deferred until a secret actually needs to be read from the vault.
+    """
+
+    def __init__(self, cfg: VaultConfig, cache: Optional[SecretCache] = None):
+        self._cfg = cfg
+        self._cache = cache
+        self._client: Any = None
+        self._lock = threading.Lock()
+        self._data: dict[str, Optional[dict[str, Any]]] = {}
+        # Whether anything new has been added to the cache since it was saved
+        self._unsaved = False
+
+    def read(self, path: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            if path not in self._data:
+                self._data[path] = self._read(path)
+            return self._data[path]
+
+    def save(self) -> None:
+        """
+        Save the secrets read from the vault to the cache, if there is one.
+        Call this once everything has been resolved, rather than rewriting the
+        cache after every read.
+        """
+        with self._lock:
+            if self._cache is not None and self._unsaved:
+                self._cache.save()
+                self._unsaved = False
+
+    def _read(self, path: str) -> Optional[dict[str, Any]]:
+        if self._cache is not None:
+            data = self._cache.get(path)
+            if data is not None:
+                return {"data": data}
+
+        if self._client is None:
+            self._client = self._cfg.client()
+        result = self._client.read(path)
+
+        if self._cache is not None and result:
+            self._cache.set(path, result["data"])
+            self._unsaved = True
+        return result
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Keep the configuration and template caches out of the user's own cache
+    # directory.
+    path = tmp_path / "cache"
+    monkeypatch.setenv("PACKIT_CACHE_DIR", str(path))
+    return path
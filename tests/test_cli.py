@@ -1,5 +1,9 @@
+import datetime as dt
 import io
+import json
 import shutil
+import subprocess
+import sys
 from contextlib import redirect_stdout
 from pathlib import Path
 from unittest import mock
@@ -30,7 +34,16 @@ def test_can_run_status(mocker):
     assert cli._read_identity.call_count == 1
     assert cli._read_identity.mock_calls[0] == mock.call(None)
     assert cli._constellation.call_count == 1
-    assert cli._constellation.mock_calls[0] == mock.call("config/noproxy")
+    assert cli._constellation.mock_calls[0] == mock.call("config/noproxy", resolve_secrets=False)
+
+
+def test_can_run_status_as_json(mocker):
+    mocker.patch("packit_deploy.cli._constellation")
+    cli._constellation.return_value.status.return_value.to_json.return_value = {"name": "packit"}
+    res = CliRunner().invoke(cli.cli, ["status", "--name", "config/noproxy", "--json"])
+    assert res.exit_code == 0
+    assert json.loads(res.output) == {"configured_as": "config/noproxy", "name": "packit"}
+    assert cli._constellation.return_value.status.mock_calls[0] == mock.call(detail=True)
 
 
 def test_that_can_configure_system():
@@ -129,3 +142,76 @@ def test_prompt_is_quite_strict():
     assert not _prompt_yes_no(lambda _: "Yes")
     assert not _prompt_yes_no(lambda _: "Great idea!")
     assert not _prompt_yes_no(lambda _: "")
+
+
+def test_can_run_start_in_parallel(mocker):
+    mocker.patch("packit_deploy.cli._constellation")
+    runner = CliRunner()
+    res = runner.invoke(cli.cli, ["start", "--parallel", "4"])
+    assert res.exit_code == 0
+    start = cli._constellation.return_value.start
+    assert start.mock_calls[0] == mock.call(pull_images=False, parallel=4)
+
+
+def test_can_run_apply(mocker):
+    mocker.patch("packit_deploy.cli._constellation")
+    runner = CliRunner()
+    res = runner.invoke(cli.cli, ["apply", "--pull"])
+    assert res.exit_code == 0
+    assert cli._constellation.mock_calls[0] == mock.call(None, options=None)
+    assert cli._constellation.return_value.apply.mock_calls[0] == mock.call(pull_images=True)
+
+
+def test_can_run_proxy_reload(mocker):
+    mocker.patch("packit_deploy.cli._constellation")
+    res = CliRunner().invoke(cli.cli, ["proxy", "reload", "--name", "config/complete"])
+    assert res.exit_code == 0
+    assert cli._constellation.mock_calls[0] == mock.call("config/complete")
+    assert cli._constellation.return_value.reload_proxy.call_count == 1
+
+
+def test_can_run_logs_stats(mocker):
+    mocker.patch("packit_deploy.cli._constellation")
+    stats = cli._constellation.return_value.proxy_log_stats.return_value
+    stats.format.return_value = "No requests found"
+    stats.to_json.return_value = {"routes": []}
+
+    res = CliRunner().invoke(cli.cli, ["logs", "stats", "--name", "config/complete"])
+    assert res.exit_code == 0
+    assert res.output == "No requests found\n"
+    assert cli._constellation.mock_calls[0] == mock.call("config/complete", resolve_secrets=False)
+    assert cli._constellation.return_value.proxy_log_stats.mock_calls[0] == mock.call(since=None)
+
+    res = CliRunner().invoke(cli.cli, ["logs", "stats", "--name", "config/complete", "--since", "1h", "--json"])
+    assert res.exit_code == 0
+    assert json.loads(res.output) == {"routes": []}
+    since = cli._constellation.return_value.proxy_log_stats.call_args.kwargs["since"]
+    assert 3590 < (dt.datetime.now(dt.timezone.utc) - since).total_seconds() < 3610
+
+
+# Modules that make up most of the CLI's startup time, which should only be
+# imported by the commands that use them.
+HEAVY_MODULES = ["docker", "requests", "jinja2", "hvac", "constellation", "packit_deploy.config"]
+
+
+def test_cli_does_not_import_heavy_modules():
+    code = "import sys, packit_deploy.cli; print(*sorted(sys.modules))"
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)  # noqa: S603
+    loaded = set(res.stdout.split())
+    for module in HEAVY_MODULES:
+        assert module not in loaded
+
+
+def test_cli_version_does_not_import_heavy_modules():
+    code = (
+        "import sys\n"
+        "from packit_deploy.cli import cli\n"
+        "cli(['--version'], standalone_mode=False)\n"
+        "print(*sorted(sys.modules))"
+    )
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)  # noqa: S603
+    assert "version" in res.stdout
+    loaded = set(res.stdout.split())
+    assert "click" in loaded
+    for module in HEAVY_MODULES:
+        assert module not in loaded
@@ -1,9 +1,24 @@
 import os
 from pathlib import Path
 
+import pytest
 from constellation import BuildSpec
 
-from packit_deploy.config import Branding, PackitConfig, Theme
+from packit_deploy.config import (
+    AccessLog,
+    Branding,
+    Compression,
+    Microcache,
+    PackitConfig,
+    ProxyCache,
+    ProxyTls,
+    ProxyTuning,
+    RequestLimit,
+    Theme,
+    Upstream,
+    duration_seconds,
+    size_bytes,
+)
 
 packit_deploy_project_root_dir = os.path.dirname(os.path.dirname(__file__))
 
@@ -53,6 +68,173 @@ def test_config_proxy() -> None:
     assert cfg.proxy is not None
 
 
+def test_config_proxy_upstream() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.upstream == Upstream(
+        keepalive=16, keepalive_requests=1000, keepalive_timeout="15s", resolver_ttl="10s"
+    )
+
+    options = {"proxy": {"upstream": {"keepalive": 64, "keepalive_timeout": "5s", "resolver_ttl": "30s"}}}
+    cfg = PackitConfig("config/novault", options=options)
+    assert cfg.proxy is not None
+    assert cfg.proxy.upstream == Upstream(
+        keepalive=64, keepalive_requests=1000, keepalive_timeout="5s", resolver_ttl="30s"
+    )
+
+    with pytest.raises(ValueError, match="Invalid duration 'soon' for proxy:upstream:keepalive_timeout"):
+        PackitConfig("config/novault", options={"proxy": {"upstream": {"keepalive_timeout": "soon"}}})
+
+
+def test_config_proxy_cache() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.cache is None
+    assert "proxy_cache" not in cfg.volumes
+
+    options = {"proxy": {"cache": {"size": "500m"}}, "volumes": {"proxy_cache": "packit_proxy_cache"}}
+    cfg = PackitConfig("config/novault", options=options)
+    assert cfg.proxy is not None
+    assert cfg.proxy.cache == ProxyCache(path="/var/cache/nginx/packit", size="500m", inactive="30d")
+    assert cfg.volumes["proxy_cache"] == "packit_proxy_cache"
+
+    with pytest.raises(ValueError, match="Invalid size '10 GB' for proxy:cache:size"):
+        PackitConfig("config/novault", options={"proxy": {"cache": {"size": "10 GB"}}})
+
+
+def test_config_proxy_compression() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.compression is None
+
+    cfg = PackitConfig("config/novault", options={"proxy": {"compression": {}}})
+    assert cfg.proxy is not None
+    assert cfg.proxy.compression == Compression(level=5, min_length=1024, types=Compression.DEFAULT_TYPES)
+
+    options = {"proxy": {"compression": {"level": 9, "min_length": 256, "types": ["text/html", "text/csv"]}}}
+    cfg = PackitConfig("config/novault", options=options)
+    assert cfg.proxy is not None
+    assert cfg.proxy.compression == Compression(level=9, min_length=256, types=["text/csv"])
+
+    with pytest.raises(ValueError, match="Unsupported compression for proxy:compression: brotli"):
+        PackitConfig("config/novault", options={"proxy": {"compression": {"algorithms": ["gzip", "brotli"]}}})
+    with pytest.raises(ValueError, match="Expected a level between 1 and 9"):
+        PackitConfig("config/novault", options={"proxy": {"compression": {"level": 11}}})
+
+
+def test_config_proxy_microcache() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.microcache is None
+
+    cfg = PackitConfig("config/novault", options={"proxy": {"microcache": {"duration": "1s"}}})
+    assert cfg.proxy is not None
+    assert cfg.proxy.microcache == Microcache(duration="1s", size="50m")
+
+    with pytest.raises(ValueError, match="Invalid duration '1 minute' for proxy:microcache:duration"):
+        PackitConfig("config/novault", options={"proxy": {"microcache": {"duration": "1 minute"}}})
+
+
+def test_config_proxy_tls() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.tls is None
+
+    cfg = PackitConfig("config/novault", options={"proxy": {"tls": {"http2": False}}})
+    assert cfg.proxy is not None
+    assert cfg.proxy.tls == ProxyTls(
+        http2=False,
+        session_cache="10m",
+        session_timeout="1d",
+        session_tickets=True,
+        ticket_key_rotation="12h",
+        ocsp_stapling=True,
+    )
+
+    with pytest.raises(ValueError, match="Invalid size '1MB' for proxy:tls:session_cache"):
+        PackitConfig("config/novault", options={"proxy": {"tls": {"session_cache": "1MB"}}})
+
+
+def test_config_startup_timeout() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.instances[None].packit_api.startup_timeout == 300
+    assert cfg.instances[None].outpack_server.startup_timeout == 60
+
+    options = {"packit": {"api": {"startup_timeout": 600}}, "outpack": {"server": {"startup_timeout": 120}}}
+    cfg = PackitConfig("config/novault", options=options)
+    assert cfg.instances[None].packit_api.startup_timeout == 600
+    assert cfg.instances[None].outpack_server.startup_timeout == 120
+
+    with pytest.raises(ValueError, match="Expected a positive number of seconds for packit:api:startup_timeout"):
+        PackitConfig("config/novault", options={"packit": {"api": {"startup_timeout": 0}}})
+
+
+def test_config_proxy_access_log() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.access_log == AccessLog(max_size="100m", keep=5)
+    assert size_bytes("100m") == 100 * 1024 * 1024
+    assert size_bytes("512") == 512
+
+    with pytest.raises(ValueError, match="Invalid size '1GB' for proxy:access_log:max_size"):
+        PackitConfig("config/novault", options={"proxy": {"access_log": {"max_size": "1GB"}}})
+    with pytest.raises(ValueError, match="Expected at least one log to keep for proxy:access_log:keep"):
+        PackitConfig("config/novault", options={"proxy": {"access_log": {"keep": 0}}})
+
+
+def test_config_proxy_tuning() -> None:
+    cfg = PackitConfig("config/novault")
+    assert cfg.proxy is not None
+    assert cfg.proxy.tuning == ProxyTuning(
+        worker_processes="auto",
+        worker_connections=1024,
+        proxy_buffer_size=None,
+        proxy_buffers=None,
+        client_body_buffer_size=None,
+        client_max_body_size=None,
+        upload_request_buffering=True,
+    )
+    assert cfg.instances[None].client_max_body_size is None
+
+    with pytest.raises(ValueError, match="Expected 'auto' or a number of processes for proxy:tuning:worker_processes"):
+        PackitConfig("config/novault", options={"proxy": {"tuning": {"worker_processes": "many"}}})
+    with pytest.raises(ValueError, match="Invalid buffers '16k' for proxy:tuning:proxy_buffers"):
+        PackitConfig("config/novault", options={"proxy": {"tuning": {"proxy_buffers": "16k"}}})
+
+    cfg = PackitConfig("config/multipackit", options={"instances": {"bar": {"proxy": {"client_max_body_size": "5g"}}}})
+    assert cfg.instances["foo"].client_max_body_size is None
+    assert cfg.instances["bar"].client_max_body_size == "5g"
+
+
+def test_config_instance_limits() -> None:
+    cfg = PackitConfig("config/multipackit")
+    assert cfg.instances["foo"].limits == {}
+
+    limits = {"api": {"rate": "10r/s", "burst": 20}, "app": {"connections": 100, "per_client": True}}
+    cfg = PackitConfig("config/multipackit", options={"instances": {"foo": {"proxy": {"limits": limits}}}})
+    assert cfg.instances["foo"].limits == {
+        "api": RequestLimit(rate="10r/s", burst=20, connections=None, per_client=False),
+        "app": RequestLimit(rate=None, burst=0, connections=100, per_client=True),
+    }
+    assert cfg.instances["bar"].limits == {}
+
+    with pytest.raises(ValueError, match="Invalid rate '10/s' for instances:foo:proxy:limits:api:rate"):
+        PackitConfig(
+            "config/multipackit", options={"instances": {"foo": {"proxy": {"limits": {"api": {"rate": "10/s"}}}}}}
+        )
+    with pytest.raises(ValueError, match="Expected a rate or a number of connections for proxy:limits:app"):
+        PackitConfig("config/novault", options={"proxy": {"limits": {"app": {"burst": 5}}}})
+
+
+def test_duration_seconds() -> None:
+    assert duration_seconds("90") == 90
+    assert duration_seconds("15m") == 900
+    assert duration_seconds("1d") == 86400
+    assert duration_seconds("10ms") == 1
+    with pytest.raises(ValueError, match="Invalid duration"):
+        duration_seconds("1 day")
+
+
 def test_basic_auth() -> None:
     cfg = PackitConfig("config/basicauth")
     instance = cfg.instances[None]
@@ -0,0 +1,108 @@
+import json
+import shutil
+
+import pytest
+from constellation.config import read_yaml
+
+from packit_deploy import config_cache
+from packit_deploy.config import PackitConfig
+from packit_deploy.config_cache import load_config
+
+
+def copy_config(tmp_path, name="basicauthcustombrand"):
+    path = tmp_path / name
+    shutil.copytree(f"config/{name}", path)
+    return str(path)
+
+
+def test_reuses_cached_config(tmp_path, mocker):
+    path = copy_config(tmp_path)
+    cfg = load_config(path)
+    spy = mocker.spy(config_cache.yaml, "load")
+    again = load_config(path)
+    assert spy.call_count == 0
+    assert again.instances[None].brand == cfg.instances[None].brand
+    assert again.container_prefix == cfg.container_prefix
+
+    # Options are applied to the cached data, not part of it
+    assert load_config(path, options={"network": "other"}).network == "other"
+    assert spy.call_count == 0
+
+
+def test_rebuilds_when_inputs_change(tmp_path, mocker, monkeypatch):
+    path = copy_config(tmp_path)
+    load_config(path)
+    spy = mocker.spy(config_cache.yaml, "load")
+
+    with open(f"{path}/packit.yml", "a") as f:
+        f.write("\n# a comment\n")
+    load_config(path)
+    assert spy.call_count == 1
+
+    monkeypatch.setattr(config_cache, "__version__", "99.0.0")
+    load_config(path)
+    assert spy.call_count == 2
+    load_config(path)
+    assert spy.call_count == 2
+
+
+def test_does_not_cache_environment_variables(tmp_path, cache_dir, monkeypatch):
+    path = copy_config(tmp_path, "noproxy")
+    dat = read_yaml(f"{path}/packit.yml")
+    dat["container_prefix"] = "$PACKIT_TEST_PREFIX"
+    with open(f"{path}/packit.yml", "w") as f:
+        json.dump(dat, f)  # JSON is valid YAML
+
+    monkeypatch.setenv("PACKIT_TEST_PREFIX", "secret-a")
+    assert load_config(path).container_prefix == "secret-a"
+    monkeypatch.setenv("PACKIT_TEST_PREFIX", "secret-b")
+    assert load_config(path).container_prefix == "secret-b"
+
+    (cache_file,) = cache_dir.iterdir()
+    assert cache_file.suffix == ".json"
+    content = cache_file.read_text()
+    assert "$PACKIT_TEST_PREFIX" in content
+    assert "secret" not in content
+
+
+def test_skips_data_json_cannot_represent(tmp_path, cache_dir):
+    path = copy_config(tmp_path)
+    with open(f"{path}/packit.yml", "a") as f:
+        f.write("\ndeployed: 2024-01-01\n")
+    assert load_config(path).container_prefix == PackitConfig(path).container_prefix
+    assert not cache_dir.exists()
+
+
+def test_ignores_corrupt_cache(tmp_path, cache_dir):
+    path = copy_config(tmp_path)
+    load_config(path)
+    for f in cache_dir.iterdir():
+        f.write_bytes(b"garbage")
+    assert load_config(path).instances[None].brand.name == PackitConfig(path).instances[None].brand.name
+
+
+def test_can_disable_cache(tmp_path, cache_dir):
+    path = copy_config(tmp_path)
+    load_config(path, cache=False)
+    assert not cache_dir.exists()
+
+
+@pytest.mark.parametrize("n", [10, 100, 1000])
+def test_many_instances_are_parsed_once(tmp_path, mocker, n):
+    dat = read_yaml("config/multipackit/packit.yml")
+    template = dat["instances"]["foo"]
+    dat["instances"] = {f"instance{i}": template for i in range(n)}
+    dat["proxy"]["image"]["build"] = str(PackitConfig("config/multipackit").proxy.image.path)
+    path = tmp_path / f"instances{n}"
+    path.mkdir()
+    with open(path / "packit.yml", "w") as f:
+        json.dump(dat, f)  # JSON is valid YAML
+
+    # The first load parses the configuration and populates the cache.
+    spy = mocker.spy(config_cache.yaml, "load")
+    first = load_config(str(path))
+    assert spy.call_count == 1
+    again = load_config(str(path))
+    assert spy.call_count == 1
+    assert len(again.instances) == n
+    assert again.instances["instance0"] == first.instances["instance0"]
@@ -1,7 +1,11 @@
+from io import BytesIO
+from tarfile import TarFile, TarInfo
+from unittest import mock
+
 import pytest
 from constellation import docker_util
 
-from packit_deploy.docker_helpers import DockerClient, write_to_container
+from packit_deploy.docker_helpers import DockerClient, patch_files, write_to_container
 
 
 @pytest.mark.parametrize("mode", [0o644, 0o666, 0o755])
@@ -18,3 +22,68 @@ def test_write_to_container(mode):
             assert owner == b"root"
         finally:
             container.remove()
+
+
+def make_tar(files, **kwargs):
+    buffer = BytesIO()
+    with TarFile(fileobj=buffer, mode="w") as tar:
+        for name, data in files.items():
+            info = TarInfo(name=name)
+            info.size = len(data)
+            for k, v in kwargs.items():
+                setattr(info, k, v)
+            tar.addfile(info, BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_patch_files_writes_everything_at_once():
+    files = {"/srv/a.txt": b"hello world", "/srv/sub/b.txt": b"one two"}
+    container = mock.Mock()
+    container.get_archive.side_effect = lambda path: (
+        [make_tar({path.split("/")[-1]: files[path]}, mode=0o640, uid=101, gid=102, uname="nginx", gname="nginx")],
+        {},
+    )
+
+    patch_files(
+        container,
+        {
+            "/srv/a.txt": lambda s: s.replace("world", "there"),
+            "/srv/sub/b.txt": lambda s: s.upper(),
+        },
+    )
+
+    assert container.get_archive.call_count == 2
+    assert not container.exec_run.called
+    container.put_archive.assert_called_once()
+    root, data = container.put_archive.call_args.args
+    assert root == "/srv"
+    with TarFile(fileobj=BytesIO(data)) as tar:
+        members = {x.name: x for x in tar.getmembers()}
+        assert set(members) == {"a.txt", "sub/b.txt"}
+        for x in members.values():
+            assert (x.mode, x.uid, x.gid, x.uname) == (0o640, 101, 102, "nginx")
+        assert tar.extractfile(members["a.txt"]).read() == b"hello there"
+        assert tar.extractfile(members["sub/b.txt"]).read() == b"ONE TWO"
+
+
+def test_patch_files_does_nothing_without_edits():
+    container = mock.Mock()
+    patch_files(container, {})
+    assert not container.get_archive.called
+    assert not container.put_archive.called
+
+
+def test_patch_files_preserves_ownership_in_container():
+    docker_util.ensure_image("alpine", "alpine:latest")
+    with DockerClient() as cl:
+        container = cl.containers.create("alpine:latest", ["sh", "-c", "stat -c '%a %u' /srv/a.txt && cat /srv/a.txt"])
+        try:
+            container.put_archive("/", make_tar({"srv/a.txt": b"before"}, mode=0o600, uid=65534, gid=65534))
+            patch_files(container, {"/srv/a.txt": lambda s: s.replace("before", "after")})
+            container.start()
+            container.wait()
+            stat, content = container.logs().splitlines()
+            assert stat == b"600 65534"
+            assert content == b"after"
+        finally:
+            container.remove()
@@ -0,0 +1,92 @@
+from unittest import mock
+
+from packit_deploy.config import PackitConfig
+from packit_deploy.fingerprint import (
+    FINGERPRINT_LABEL,
+    container_fingerprint,
+    is_current,
+    orphaned_containers,
+    set_fingerprint,
+)
+from packit_deploy.packit_constellation import PackitConstellation
+
+
+def fingerprints(path, options=None):
+    obj = PackitConstellation(PackitConfig(path, options=options))
+    ret = {}
+    for x in obj.obj.containers.collection:
+        payload = obj.payloads[x.name]() if x.name in obj.payloads else None
+        ret[x.name] = container_fingerprint(x, "sha256:abc", obj.obj.volumes, payload)
+    return ret
+
+
+def test_fingerprints_are_stable():
+    assert fingerprints("config/complete") == fingerprints("config/complete")
+
+
+def test_fingerprint_changes_only_for_affected_containers():
+    prev = fingerprints("config/multipackit")
+    curr = fingerprints("config/multipackit", options={"instances": {"foo": {"packit": {"db": {"password": "x"}}}}})
+    changed = {k for k in prev if prev[k] != curr[k]}
+    assert changed == {"foo-packit-api"}
+
+
+def test_fingerprint_includes_configure_payloads():
+    prev = fingerprints("config/multipackit")
+    curr = fingerprints("config/multipackit", options={"instances": {"bar": {"brand": {"name": "Baz"}}}})
+    changed = {k for k in prev if prev[k] != curr[k]}
+    # The brand name is written into the app. It is also listed on the proxy's
+    # index page, but apply updates the proxy's configuration in place.
+    assert changed == {"bar-packit", "bar-packit-api"}
+
+
+def test_fingerprint_includes_image():
+    obj = PackitConstellation(PackitConfig("config/noproxy"))
+    x = obj.obj.containers.find("packit-db")
+    assert container_fingerprint(x, "sha256:a", obj.obj.volumes) != container_fingerprint(
+        x, "sha256:b", obj.obj.volumes
+    )
+
+
+def test_set_fingerprint_labels_services():
+    obj = PackitConstellation(PackitConfig("config/runner"))
+    worker = obj.obj.containers.find("orderly-runner-worker")
+    set_fingerprint(worker, "abc")
+    assert worker.kwargs["labels"] == {FINGERPRINT_LABEL: "abc"}
+    assert worker.base.labels == {FINGERPRINT_LABEL: "abc"}
+
+
+def test_is_current():
+    def container(fingerprint, status="running"):
+        return mock.Mock(status=status, labels={FINGERPRINT_LABEL: fingerprint})
+
+    obj = PackitConstellation(PackitConfig("config/runner"))
+    db = obj.obj.containers.find("packit-db")
+    with mock.patch.object(db, "get", return_value=None):
+        assert not is_current(db, "packit", "abc")
+    with mock.patch.object(db, "get", return_value=container("abc")):
+        assert is_current(db, "packit", "abc")
+        assert not is_current(db, "packit", "def")
+    with mock.patch.object(db, "get", return_value=container("abc", status="exited")):
+        assert not is_current(db, "packit", "abc")
+
+    worker = obj.obj.containers.find("orderly-runner-worker")
+    with mock.patch.object(worker, "get", return_value=[container("abc"), container("abc")]):
+        assert is_current(worker, "packit", "abc")
+    with mock.patch.object(worker, "get", return_value=[container("abc")]):
+        assert not is_current(worker, "packit", "abc")
+
+
+def test_finds_orphaned_containers():
+    obj = PackitConstellation(PackitConfig("config/complete"))
+    names = ["packit-packit-api", "packit-orderly-runner-worker-a1b2", "packit-foo-packit-api", "packit-old-thing"]
+    found = []
+    for name in names:
+        found.append(mock.Mock())
+        found[-1].name = name
+    client = mock.Mock()
+    client.containers.list.return_value = found
+    assert [x.name for x in orphaned_containers(client, obj.obj)] == ["packit-foo-packit-api", "packit-old-thing"]
+    assert client.containers.list.call_args == mock.call(
+        all=True, filters={"label": FINGERPRINT_LABEL, "name": "^/packit-"}
+    )
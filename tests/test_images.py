@@ -0,0 +1,212 @@
+import json
+from unittest import mock
+
+import docker
+import pytest
+
+from packit_deploy.cache import cache_dir
+from packit_deploy.config import PackitConfig
+from packit_deploy.images import ManifestCache, format_bytes, image_references, pull_images
+
+
+def test_image_references_are_deduplicated():
+    cfg = PackitConfig("config/multipackit")
+    assert image_references(cfg) == [
+        "ghcr.io/mrc-ide/outpack_server:main",
+        "ghcr.io/mrc-ide/packit-db:main",
+        "ghcr.io/mrc-ide/packit-api:main",
+        "ghcr.io/mrc-ide/packit:main",
+        "ghcr.io/reside-ic/acme-buddy:main",
+    ]
+
+
+def test_image_references_include_runner():
+    cfg = PackitConfig("config/complete")
+    refs = image_references(cfg)
+    assert "library/redis:8.0" in refs
+    assert refs.count("ghcr.io/mrc-ide/orderly.runner:main") == 1
+    # The proxy is built locally, so is never pulled
+    assert not any("proxy" in x for x in refs)
+
+
+def pull_events(ref, downloads=()):
+    """
+    The progress docker reports while pulling an image, which downloads the
+    layers in `downloads` (a map of layer id to size) and already has another.
+    """
+    events = [
+        {"status": f"Pulling from {ref}", "id": "1"},
+        {"status": "Already exists", "progressDetail": {}, "id": "a0"},
+    ]
+    for layer, size in downloads.items():
+        events += [
+            {"status": "Pulling fs layer", "progressDetail": {}, "id": layer},
+            {"status": "Downloading", "progressDetail": {"current": size // 2, "total": size}, "id": layer},
+            {"status": "Downloading", "progressDetail": {"current": size, "total": size}, "id": layer},
+            {"status": "Download complete", "progressDetail": {}, "id": layer},
+            {"status": "Extracting", "progressDetail": {"current": size * 3, "total": size * 3}, "id": layer},
+            {"status": "Pull complete", "progressDetail": {}, "id": layer},
+        ]
+    return [*events, {"status": f"Status: Downloaded newer image for {ref}"}]
+
+
+def mock_docker(mocker, local, remote, downloads=None):
+    """
+    A docker client that has the images in `local`, and pulls those in
+    `remote`, downloading the layers in `downloads`.
+    """
+    client = mocker.patch("docker.client.from_env").return_value
+    images = dict(local)
+    downloads = downloads or {}
+
+    def get(ref):
+        if ref not in images:
+            raise docker.errors.ImageNotFound(ref)
+        return images[ref]
+
+    def pull(repository, tag, **_kwargs):
+        ref = f"{repository}:{tag}"
+        images[ref] = remote[ref]
+        return iter(pull_events(ref, downloads.get(ref, {})))
+
+    client.images.get.side_effect = get
+    client.api.pull.side_effect = pull
+    return client
+
+
+def test_pull_images_reports_progress(mocker, capsys):
+    local = {"a:1": mock.Mock(id="sha256:aaa"), "b:2": mock.Mock(id="sha256:aaa")}
+    remote = {"a:1": mock.Mock(id="sha256:bbb", short_id="bbb"), "b:2": mock.Mock(id="sha256:aaa", short_id="aaa")}
+    downloads = {"a:1": {"l1": 2_000_000, "l2": 3_000_000}}
+    client = mock_docker(mocker, local, remote, downloads)
+
+    res = pull_images(["a:1", "b:2"], max_workers=2)
+    assert [x.ref for x in res] == ["a:1", "b:2"]
+    assert [x.updated for x in res] == [True, False]
+    assert [x.size for x in res] == [5_000_000, 0]
+    assert client.api.pull.call_count == 2
+    assert client.api.pull.call_args_list[0] == mock.call("a", tag="1", stream=True, decode=True)
+
+    out = capsys.readouterr().out
+    assert "[2/2] Pulled" in out
+    assert "Pulled a:1 -> bbb (updated) in" in out
+    assert ", 5.0 MB downloaded" in out
+    assert "Pulled 2 images (1 updated, 0 already current, 5.0 MB downloaded)" in out
+
+
+def test_pull_images_reports_errors(mocker):
+    client = mock_docker(mocker, {}, {})
+    client.api.pull.side_effect = lambda *_args, **_kwargs: iter([{"error": "manifest unknown"}])
+    with pytest.raises(Exception, match="Failed to pull a:1: manifest unknown"):
+        pull_images(["a:1"])
+
+
+def test_pull_nothing(mocker):
+    from_env = mocker.patch("docker.client.from_env")
+    assert pull_images([]) == []
+    assert not from_env.called
+
+
+def test_format_bytes():
+    assert format_bytes(12) == "12 B"
+    assert format_bytes(1500) == "1.5 kB"
+    assert format_bytes(123_400_000) == "123.4 MB"
+    assert format_bytes(2e12) == "2.0 TB"
+
+
+def fake_image(digest, image_id="sha256:abc"):
+    return mock.Mock(
+        id=image_id,
+        short_id=image_id[:12],
+        attrs={"RepoDigests": [f"example.com/img@{digest}"]},
+    )
+
+
+def test_manifest_cache_expires_entries(tmp_path):
+    now = 1000.0
+    cache = ManifestCache(tmp_path / "manifests.json", ttl=60, clock=lambda: now)
+    assert cache.get("a:1") is None
+    cache.set("a:1", "sha256:111")
+    assert cache.get("a:1") == "sha256:111"
+    cache.save()
+
+    now += 61
+    assert cache.get("a:1") is None
+    reloaded = ManifestCache(tmp_path / "manifests.json", ttl=120, clock=lambda: now)
+    assert reloaded.get("a:1") == "sha256:111"
+
+
+def test_manifest_cache_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "manifests.json"
+    path.write_text("{not json")
+    assert ManifestCache(path).get("a:1") is None
+
+    path.write_text('["a:1"]')
+    assert ManifestCache(path).get("a:1") is None
+
+    entries = {
+        "a:1": {"digest": "sha256:111"},
+        "b:1": "sha256:111",
+        "c:1": {"digest": "sha256:111", "checked": "yesterday"},
+        "d:1": {"digest": "sha256:111", "checked": 1000.0},
+    }
+    path.write_text(json.dumps(entries))
+    cache = ManifestCache(path, clock=lambda: 1000.0)
+    assert [cache.get(x) for x in entries] == [None, None, None, "sha256:111"]
+
+
+def test_pull_succeeds_if_manifest_cache_cannot_be_saved(mocker, tmp_path):
+    mock_docker(mocker, {}, {"a:1": fake_image("sha256:111")})
+    (tmp_path / "cache").write_text("not a directory")
+    cache = ManifestCache(tmp_path / "cache" / "manifests.json")
+
+    res = pull_images(["a:1"], cache=cache)
+    assert res[0].updated
+
+
+def test_pull_skips_current_images(mocker, tmp_path):
+    client = mock_docker(mocker, {"a:1": fake_image("sha256:111")}, {})
+    registry = {"a:1": "sha256:111"}
+    lookup = mock.Mock(side_effect=lambda _client, ref: registry[ref])
+    cache = ManifestCache(tmp_path / "manifests.json")
+
+    res = pull_images(["a:1"], cache=cache, lookup=lookup)
+    assert res[0].skipped
+    assert not client.api.pull.called
+    assert lookup.call_count == 1
+
+    # The registry is not asked again while the cached digest is fresh:
+    res = pull_images(["a:1"], cache=ManifestCache(tmp_path / "manifests.json"), lookup=lookup)
+    assert res[0].skipped
+    assert lookup.call_count == 1
+
+
+def test_pull_fetches_stale_images(mocker, tmp_path):
+    local = {"a:1": fake_image("sha256:111")}
+    remote = {"a:1": fake_image("sha256:222", image_id="sha256:def")}
+    client = mock_docker(mocker, local, remote)
+    lookup = mock.Mock(return_value="sha256:222")
+    cache = ManifestCache(tmp_path / "manifests.json")
+
+    res = pull_images(["a:1"], cache=cache, lookup=lookup)
+    assert not res[0].skipped
+    assert res[0].updated
+    client.api.pull.assert_called_once_with("a", tag="1", stream=True, decode=True)
+    assert cache.get("a:1") == "sha256:222"
+
+
+def test_pull_falls_back_if_registry_unavailable(mocker, tmp_path):
+    client = mock_docker(mocker, {"a:1": fake_image("sha256:111")}, {"a:1": fake_image("sha256:111")})
+    lookup = mock.Mock(side_effect=docker.errors.APIError("unauthorized"))
+
+    res = pull_images(["a:1"], cache=ManifestCache(tmp_path / "manifests.json"), lookup=lookup)
+    assert not res[0].skipped
+    assert client.api.pull.called
+
+
+def test_cache_dir_can_be_overridden(monkeypatch, tmp_path):
+    monkeypatch.setenv("PACKIT_CACHE_DIR", str(tmp_path))
+    assert cache_dir() == tmp_path
+    monkeypatch.delenv("PACKIT_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert cache_dir() == tmp_path / "packit-deploy"
@@ -0,0 +1,104 @@
+import datetime as dt
+import gzip
+import io
+import json
+import tarfile
+
+import pytest
+
+from packit_deploy.logs import log_stats, parse_entries, percentile, read_access_logs, route
+
+T0 = dt.datetime(2025, 1, 1, 12, 0, 0, tzinfo=dt.timezone.utc)
+HOSTNAMES = {"foo.example.com": "foo", "bar.example.com": "bar"}
+
+
+def entry(seconds, request_time, *, host="foo.example.com", method="GET", uri="/api/packets"):
+    return {
+        "time": (T0 + dt.timedelta(seconds=seconds)).isoformat(),
+        "host": host,
+        "method": method,
+        "uri": uri,
+        "status": 200,
+        "request_time": request_time,
+    }
+
+
+def test_route_replaces_identifiers():
+    assert route("GET", "/api/packets/20240101-123456-abcdef01?x=1") == "GET /api/packets/{id}"
+    assert route("POST", "/api/outpack/file/sha256:" + "a" * 64) == "POST /api/outpack/file/{hash}"
+    assert route("GET", "/assets/index-BXa1_2cD.js") == "GET /assets/{asset}"
+    assert route("GET", "/api/roles/12/users") == "GET /api/roles/{n}/users"
+    assert route("GET", "/api/user/0a1b2c3d-0000-4000-8000-0123456789ab") == "GET /api/user/{uuid}"
+    assert route("GET", "/") == "GET /"
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(x) for x in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([0.5], 99) == 0.5
+
+
+def test_log_stats_groups_by_instance_and_route():
+    entries = [entry(i, 0.01 * (i + 1)) for i in range(100)]
+    entries += [entry(i, 1.0, host="bar.example.com", uri="/") for i in range(10)]
+    entries += [entry(0, 2.0, host="other"), {"time": "nonsense"}, {}]
+    res = log_stats(entries, HOSTNAMES)
+
+    assert res.skipped == 2
+    assert res.start == T0
+    assert res.end == T0 + dt.timedelta(seconds=99)
+    assert [(x.instance, x.count) for x in res.instances] == [("bar", 10), ("foo", 100), ("other", 1)]
+    foo = res.instances[1]
+    assert foo.p50 == pytest.approx(0.5)
+    assert foo.p95 == pytest.approx(0.95)
+    assert foo.p99 == pytest.approx(0.99)
+    assert foo.rate == pytest.approx(100 / 99, abs=1e-3)
+    assert [(x.instance, x.route) for x in res.routes] == [
+        ("bar", "GET /"),
+        ("foo", "GET /api/packets"),
+        ("other", "GET /api/packets"),
+    ]
+
+    text = res.format()
+    assert text.startswith("111 requests from 2025-01-01T12:00:00+00:00")
+    assert "foo              (all)" in text
+    assert json.loads(json.dumps(res.to_json()))["instances"][0]["instance"] == "bar"
+
+
+def test_log_stats_filters_by_window():
+    entries = [entry(i * 60, 0.1) for i in range(10)]
+    res = log_stats(entries, HOSTNAMES, since=T0 + dt.timedelta(minutes=5))
+    assert res.instances[0].count == 5
+    assert res.start == T0 + dt.timedelta(minutes=5)
+
+    res = log_stats(entries, HOSTNAMES, since=T0 + dt.timedelta(hours=1))
+    assert res.instances == []
+    assert res.format() == "No requests found"
+
+
+def archive_chunks(files, chunk_size=100):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(f"nginx/{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    data = buf.getvalue()
+    return (data[i : i + chunk_size] for i in range(0, len(data), chunk_size))
+
+
+def test_reads_current_and_rotated_access_logs():
+    lines = [json.dumps(entry(i, 0.1)).encode() + b"\n" for i in range(3)]
+    files = {
+        "access.log": b"not json\n",
+        "error.log": b"an error\n",
+        "packit-access.log": lines[0],
+        "packit-access.log.1": lines[1],
+        "packit-access.log.2.gz": gzip.compress(lines[2]),
+    }
+    res = list(read_access_logs(archive_chunks(files)))
+    assert res == lines
+    parsed = list(parse_entries([*res, b"garbage\n", b"[]\n"]))
+    assert [x.get("time") for x in parsed] == [entry(i, 0.1)["time"] for i in range(3)] + [None, None]
@@ -1,5 +1,24 @@
+import io
+import json
+import re
+import tarfile
+from unittest import mock
+
+import docker
+import jinja2
+import pytest
+from docker.models.containers import ExecResult
+
+from packit_deploy import packit_constellation
 from packit_deploy.config import PackitConfig
-from packit_deploy.packit_constellation import packit_api_get_env
+from packit_deploy.packit_constellation import (
+    PackitConstellation,
+    TemplateCache,
+    packit_api_get_env,
+    packit_file_edits,
+    proxy_config_hash,
+    proxy_render,
+)
 
 
 def test_environment_with_no_runner_contains_no_envvars():
@@ -52,3 +71,545 @@ def test_can_set_base_url():
     cfg = PackitConfig("config/noproxy")
     env = packit_api_get_env(cfg.instances[None], cfg.orderly_runner)
     assert env["PACKIT_BASE_URL"] == "https://example.com/packit"
+
+
+def test_start_dependencies():
+    cfg = PackitConfig("config/multipackit")
+    obj = PackitConstellation(cfg)
+    assert obj.dependencies["foo-packit-api"] == ["foo-packit-db"]
+    assert obj.dependencies["bar-packit-api"] == ["bar-packit-db"]
+    # nginx resolves the backends at runtime, so can start without them
+    assert "proxy" not in obj.dependencies
+    assert obj.dependencies["acme-buddy"] == ["proxy"]
+    assert "foo-packit-db" not in obj.dependencies
+
+
+def test_start_dependencies_with_runner():
+    cfg = PackitConfig("config/runner")
+    obj = PackitConstellation(cfg)
+    assert obj.dependencies["orderly-runner-api"] == ["redis"]
+    assert obj.dependencies["orderly-runner-worker"] == ["redis"]
+
+
+def test_packit_file_edits_with_branding():
+    cfg = PackitConfig("config/complete")
+    edits = packit_file_edits(cfg.instances[None])
+    assert set(edits) == {"/usr/share/nginx/html/index.html", "/usr/share/nginx/html/css/custom.css"}
+
+    index = '<title>Packit</title><link rel="icon" href="/favicon.ico">'
+    assert edits["/usr/share/nginx/html/index.html"](index) == (
+        '<title>My Packit Instance</title><link rel="icon" href="/examplefavicon.ico">'
+    )
+    css = edits["/usr/share/nginx/html/css/custom.css"]("old content")
+    assert "--custom-accent: hsl(0 100% 50%);" in css
+    assert "old content" not in css
+
+
+def test_packit_file_edits_without_branding():
+    cfg = PackitConfig("config/noproxy")
+    edits = packit_file_edits(cfg.instances[None])
+    assert set(edits) == {"/usr/share/nginx/html/css/custom.css"}
+    assert edits["/usr/share/nginx/html/css/custom.css"]("old content") == ""
+
+
+def test_proxy_uses_keepalive_upstreams():
+    cfg = PackitConfig("config/multipackit", options={"proxy": {"upstream": {"keepalive_requests": 500}}})
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "upstream foo-packit-api {\n    zone foo-packit-api 64k;\n    server foo-packit-api:8080 resolve;\n" in conf
+    assert (
+        "upstream bar-outpack-server {\n    zone bar-outpack-server 64k;\n    server bar-outpack-server:8000 resolve;"
+        in conf
+    )
+    assert "upstream foo-packit-api-management {\n    zone foo-packit-api-management 64k;\n" in conf
+    assert conf.count("keepalive_requests 500;") == 8
+    assert "proxy_pass http://foo-packit-api/;" in conf
+    assert "proxy_pass http://bar-packit/;" in conf
+    assert "proxy_pass http://foo-outpack-server/metrics;" in conf
+    assert "proxy_pass http://foo-packit-api-management/prometheus;" in conf
+    # Every backend is looked up by nginx as it runs
+    assert "resolver 127.0.0.11 valid=10s ipv6=off;" in conf
+    assert len(re.findall(r"proxy_pass http://[a-z-]+:", conf)) == 0
+    assert conf.count("proxy_http_version 1.1;") == 4
+    assert conf.count('proxy_set_header Connection "";') == 4
+
+
+def test_proxy_without_cache_does_not_load_njs():
+    cfg = PackitConfig("config/novault")
+    files = proxy_render(cfg, cfg.proxy)
+    assert "load_module" not in files["/etc/nginx/nginx.conf"]
+    assert "/etc/nginx/packit_metrics.js" not in files
+    assert "proxy_cache" not in files["/etc/nginx/conf.d/default.conf"]
+    assert "js_" not in files["/etc/nginx/conf.d/default.conf"]
+
+
+def test_proxy_caches_outpack_content():
+    options = {
+        "proxy": {"cache": {"inactive": "7d"}, "port_metrics": 9000},
+        "volumes": {"proxy_cache": "packit_proxy_cache"},
+    }
+    cfg = PackitConfig("config/novault", options=options)
+    files = proxy_render(cfg, cfg.proxy)
+    conf = files["/etc/nginx/conf.d/default.conf"]
+    assert "proxy_cache_path /var/cache/nginx/packit levels=1:2 keys_zone=packit_outpack:10m max_size=10g" in conf
+    assert "inactive=7d" in conf
+    assert "auth_request /_auth/outpack;" in conf
+    assert "proxy_hide_header Set-Cookie;" in conf
+    assert "add_header X-Cache-Status $upstream_cache_status always;" in conf
+    assert "js_content packit_metrics.report;" in conf
+    assert "load_module modules/ngx_http_js_module.so;" in files["/etc/nginx/nginx.conf"]
+    assert "export default { cache_status, limited, report };" in files["/etc/nginx/packit_metrics.js"]
+
+    obj = PackitConstellation(cfg)
+    proxy = obj.obj.containers.find("proxy")
+    assert [(m.name, m.target) for m in proxy.mounts] == [
+        ("proxy_logs", "/var/log/nginx"),
+        ("packit-tls", "/run/proxy"),
+        ("proxy_cache", "/var/cache/nginx/packit"),
+    ]
+
+
+def test_outpack_cache_only_matches_immutable_content():
+    cfg = PackitConfig("config/novault", options={"proxy": {"cache": {}}, "volumes": {"proxy_cache": "cache"}})
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    pattern = re.search(r'location ~ "(.+)"', conf).group(1)
+    assert re.match(pattern, "/api/outpack/file/sha256:" + "a" * 64)
+    assert re.match(pattern, "/api/outpack/metadata/20240101-123456-abcdef01/json")
+    assert not re.match(pattern, "/api/outpack/metadata/list")
+    assert not re.match(pattern, "/api/outpack/file/sha256:abc/../../etc/passwd")
+
+
+def test_proxy_can_serve_outpack_files():
+    cfg = PackitConfig("config/multipackit")
+    assert cfg.proxy is not None
+    assert not cfg.proxy.serve_outpack_files
+    assert "alias" not in proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+
+    cfg = PackitConfig("config/multipackit", options={"proxy": {"serve_outpack_files": True}})
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "alias /srv/outpack/foo/.outpack/files/sha256/$1/$2;" in conf
+    assert "alias /srv/outpack/bar/.outpack/files/sha256/$1/$2;" in conf
+    assert conf.count("location = /_auth/outpack {") == 2
+    assert conf.count("error_page 404 405 = @outpack;") == 2
+    auth = re.findall(r"location = /_auth/outpack \{\n(.*?)\n    \}", conf, re.DOTALL)
+    assert len(auth) == 2
+    assert all('proxy_set_header Connection "";' in x for x in auth)
+
+    pattern = re.search(r'location ~ "(.+)" \{\n        auth_request /_auth/outpack;\n        alias', conf).group(1)
+    m = re.match(pattern, "/api/outpack/file/sha256:ab" + "c" * 62)
+    assert m is not None
+    assert m.groups() == ("ab", "c" * 62)
+
+    obj = PackitConstellation(cfg)
+    mounts = {m.target: m for m in obj.obj.containers.find("proxy").mounts}
+    assert mounts["/srv/outpack/foo"].name == "foo/outpack"
+    assert mounts["/srv/outpack/foo"].kwargs["read_only"]
+    assert mounts["/srv/outpack/bar"].name == "bar/outpack"
+
+
+def test_proxy_compression():
+    cfg = PackitConfig("config/novault")
+    assert "gzip" not in proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+
+    cfg = PackitConfig("config/novault", options={"proxy": {"compression": {"level": 3, "types": ["text/css"]}}})
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "gzip on;\ngzip_comp_level 3;\ngzip_min_length 1024;\ngzip_types text/css;" in conf
+
+
+def test_proxy_sets_cache_headers_for_app_assets():
+    cfg = PackitConfig("config/novault")
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "add_header Cache-Control $packit_app_cache_control;" in conf
+    assert "proxy_hide_header Cache-Control;" in conf
+    assert "packit_app:10m" not in conf
+    assert "X-Cache-Status" not in conf
+
+    block = re.search(r"map \$request_uri \$packit_app_cache_control \{\n(.+?)\n\}", conf, re.DOTALL).group(1)
+    rules = [re.fullmatch(r'\s*"?(.+?)"?\s+"(.*)";', x).groups() for x in block.splitlines()]
+
+    def cache_control(uri):
+        for pattern, value in rules:
+            if pattern == "default" or re.search(pattern.lstrip("~"), uri):
+                return value
+        return None
+
+    assert cache_control("/assets/index-BXa1_2cD.js") == "public, max-age=31536000, immutable"
+    assert cache_control("/assets/index-D4vQ8k3Z.css?v=1") == "public, max-age=31536000, immutable"
+    assert cache_control("/assets/logo.svg") == "no-cache"
+    assert cache_control("/index.html") == "no-cache"
+    assert cache_control("/css/custom.css") == "no-cache"
+    assert cache_control("/packets/foo") == "no-cache"
+    assert cache_control("/api/packets") == ""
+    assert cache_control("/api/assets/x-BXa1_2cD.js") == ""
+
+
+def test_proxy_microcache():
+    cfg = PackitConfig("config/novault", options={"proxy": {"microcache": {"duration": "2s", "size": "20m"}}})
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "keys_zone=packit_app:10m max_size=20m" in conf
+    assert "proxy_cache_valid 200 301 302 2s;" in conf
+    assert "proxy_cache_bypass $http_authorization $http_cookie;" in conf
+    assert "proxy_no_cache $http_authorization $http_cookie;" in conf
+    assert "add_header X-Cache-Status $upstream_cache_status always;" in conf
+    # Kept in the container rather than on a volume
+    obj = PackitConstellation(cfg)
+    assert [m.name for m in obj.obj.containers.find("proxy").mounts] == ["proxy_logs", "packit-tls"]
+
+
+def test_proxy_tls_profile():
+    cfg = PackitConfig("config/novault")
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "http2" not in conf
+    assert "ssl_session_ticket" not in conf
+    assert "ssl_session_cache shared:SSL:10m;" in conf
+    assert "PACKIT_TICKET_KEY_ROTATION" not in PackitConstellation(cfg).obj.containers.find("proxy").environment
+
+    options = {"proxy": {"tls": {"session_cache": "50m", "ticket_key_rotation": "6h"}}}
+    cfg = PackitConfig("config/novault", options=options)
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    assert "    listen       443 ssl;\n    http2        on;\n" in conf
+    assert "ssl_session_cache shared:SSL:50m;" in conf
+    assert "ssl_session_timeout 1d;" in conf
+    assert "ssl_session_ticket_key /run/proxy/tickets/current.key;" in conf
+    # Self-signed certificates have no OCSP responder
+    assert "ssl_stapling" not in conf
+    proxy = PackitConstellation(cfg).obj.containers.find("proxy")
+    assert proxy.environment["PACKIT_TICKET_KEY_ROTATION"] == "21600"
+
+
+def test_proxy_tls_profile_with_acme():
+    options = {"proxy": {"tls": {"session_tickets": False}}}
+    cfg = PackitConfig("config/multipackit", options=options)
+    conf = proxy_render(cfg, cfg.proxy)["/etc/nginx/conf.d/default.conf"]
+    # Each instance, plus the index
+    assert conf.count("http2        on;") == 3
+    assert "ssl_session_tickets off;" in conf
+    assert "ssl_stapling on;" in conf
+    assert conf.count("resolver 127.0.0.11") == 1
+    assert "PACKIT_TICKET_KEY_ROTATION" not in PackitConstellation(cfg).obj.containers.find("proxy").environment
+
+
+def test_proxy_access_log_rotation():
+    cfg = PackitConfig("config/novault")
+    environment = PackitConstellation(cfg).obj.containers.find("proxy").environment
+    assert environment["PACKIT_ACCESS_LOG_MAX_SIZE"] == str(100 * 1024 * 1024)
+    assert environment["PACKIT_ACCESS_LOG_KEEP"] == "5"
+
+    options = {"proxy": {"access_log": {"max_size": "1g", "keep": 2}}}
+    cfg = PackitConfig("config/novault", options=options)
+    environment = PackitConstellation(cfg).obj.containers.find("proxy").environment
+    assert environment["PACKIT_ACCESS_LOG_MAX_SIZE"] == str(1024**3)
+    assert environment["PACKIT_ACCESS_LOG_KEEP"] == "2"
+
+
+def test_proxy_tuning():
+    cfg = PackitConfig("config/multipackit")
+    files = proxy_render(cfg, cfg.proxy)
+    main = files["/etc/nginx/nginx.conf"]
+    assert "worker_processes  auto;" in main
+    assert "worker_connections  1024;" in main
+    assert "client_max_body_size" not in main
+    assert "proxy_buffers" not in main
+    assert "client_max_body_size" not in files["/etc/nginx/conf.d/default.conf"]
+    assert "proxy_request_buffering" not in files["/etc/nginx/conf.d/default.conf"]
+
+    options = {
+        "proxy": {
+            "cache": {},
+            "serve_outpack_files": True,
+            "tuning": {
+                "worker_processes": 4,
+                "worker_connections": 4096,
+                "proxy_buffers": "16 32k",
+                "client_body_buffer_size": "1m",
+                "client_max_body_size": "1g",
+                "upload_request_buffering": False,
+            },
+        },
+        "instances": {"foo": {"proxy": {"client_max_body_size": "0"}}},
+        "volumes": {"proxy_cache": "cache"},
+    }
+    cfg = PackitConfig("config/multipackit", options=options)
+    files = proxy_render(cfg, cfg.proxy)
+    main = files["/etc/nginx/nginx.conf"]
+    assert "worker_processes  4;" in main
+    assert "worker_connections  4096;" in main
+    assert "proxy_buffers  16 32k;" in main
+    assert "client_body_buffer_size  1m;" in main
+    assert "client_max_body_size  1g;" in main
+
+    conf = files["/etc/nginx/conf.d/default.conf"]
+    servers = conf.split("# Main server configuration.")
+    assert "client_max_body_size 0;" in servers[1]
+    assert "client_max_body_size" not in servers[2]
+    assert "location /api/outpack/ {\n        proxy_request_buffering off;" in conf
+    # The outpack location, the fallback for files not in the file store and
+    # the cache location, in each instance
+    assert conf.count("proxy_request_buffering off;") == 6
+
+
+def test_proxy_writes_json_access_log():
+    cfg = PackitConfig("config/novault")
+    main = proxy_render(cfg, cfg.proxy)["/etc/nginx/nginx.conf"]
+    assert "access_log  /var/log/nginx/packit-access.log  packit;" in main
+    fmt = re.search(r"log_format  packit  escape=json (.+?);\n", main, re.DOTALL).group(1)
+    template = "".join(re.findall(r"'(.+?)'", fmt))
+    # Substitute some values to check that each line is valid JSON
+    values = {"status": "200", "bytes_sent": "512", "request_time": "0.012"}
+    line = re.sub(r"\$([a-z0-9_]+)", lambda m: values.get(m.group(1), "x"), template)
+    assert set(json.loads(line)) == {
+        "time",
+        "host",
+        "method",
+        "uri",
+        "status",
+        "bytes_sent",
+        "request_time",
+        "upstream",
+        "upstream_response_time",
+        "cache",
+    }
+
+
+def test_proxy_log_stats_reads_from_proxy(mocker):
+    cfg = PackitConfig("config/multipackit")
+    obj = PackitConstellation(cfg)
+    line = {"time": "2025-01-01T12:00:00+00:00", "host": "foo.localhost", "method": "GET", "uri": "/"}
+    content = json.dumps({**line, "request_time": 0.25}).encode() + b"\n"
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        info = tarfile.TarInfo("nginx/packit-access.log")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    container = mock.Mock()
+    container.get_archive.return_value = (iter([buf.getvalue()]), {})
+    mocker.patch.object(obj.obj.containers, "get", return_value=container)
+
+    res = obj.proxy_log_stats()
+    assert container.get_archive.call_args == mock.call("/var/log/nginx")
+    assert [(x.instance, x.route, x.p99) for x in res.routes] == [("foo", "GET /", 0.25)]
+
+
+def test_start_waits_for_health_with_configured_timeout(mocker):
+    options = {"packit": {"api": {"startup_timeout": 600}}}
+    obj = PackitConstellation(PackitConfig("config/novault", options=options))
+    wait = mocker.patch("packit_deploy.readiness.wait_until_ready")
+    container = mock.Mock()
+    container.name = "packit-api"
+    obj.obj.containers.find("packit-api").configure(container, None)
+    assert wait.call_args.kwargs["timeout"] == 600
+    assert not wait.call_args.kwargs["required"]
+    obj.obj.containers.find("outpack-server").configure(container, None)
+    assert wait.call_args.kwargs["timeout"] == 60
+
+
+def test_proxy_generates_self_signed_certificate_for_every_hostname(mocker):
+    cfg = PackitConfig("config/multipackit")
+    cfg.acme_config = None
+    assert cfg.volumes["packit-tls"] == "packit-tls"
+    exec_safely = mocker.patch("constellation.docker_util.exec_safely")
+    mocker.patch("packit_deploy.readiness.wait_until_ready")
+    packit_constellation.proxy_configure(mock.Mock(), cfg)
+    assert exec_safely.call_args.args[1] == [
+        "self-signed-certificate",
+        "--hostnames",
+        "/run/proxy",
+        "localhost",
+        "foo.localhost",
+        "bar.localhost",
+    ]
+
+    cfg = PackitConfig("config/novault", options={"volumes": {"proxy_tls": "my_tls"}})
+    assert cfg.volumes["packit-tls"] == "my_tls"
+    packit_constellation.proxy_configure(mock.Mock(), cfg)
+    assert exec_safely.call_args.args[1][2:] == ["/run/proxy", "localhost"]
+
+
+def test_proxy_limits_requests_per_instance():
+    limits = {
+        "api": {"rate": "20r/s", "burst": 40, "connections": 50},
+        "app": {"connections": 100, "per_client": True},
+    }
+    options = {
+        "proxy": {"cache": {}},
+        "volumes": {"proxy_cache": "cache"},
+        "instances": {"foo": {"proxy": {"limits": limits}}},
+    }
+    cfg = PackitConfig("config/multipackit", options=options)
+    files = proxy_render(cfg, cfg.proxy)
+    conf = files["/etc/nginx/conf.d/default.conf"]
+    assert "limit_req_status 429;" in conf
+    assert "limit_req_zone $server_name zone=packit_foo_api_requests:1m rate=20r/s;" in conf
+    assert "limit_conn_zone $binary_remote_addr zone=packit_foo_app_connections:10m;" in conf
+    assert "packit_foo_app_requests" not in conf
+
+    foo, bar = conf.split("# Main server configuration.")[1:]
+    assert "location /api/ {\n        limit_req zone=packit_foo_api_requests burst=40 nodelay;\n" in foo
+    assert "        limit_conn packit_foo_api_connections 50;\n        proxy_pass" in foo
+    # The outpack cache location is an API location too
+    assert foo.count("limit_req zone=packit_foo_api_requests") == 2
+    assert "location / {\n        limit_conn packit_foo_app_connections 100;\n" in foo
+    assert "js_header_filter packit_metrics.limited;" in foo
+    assert "limit_" not in bar
+    assert "packit_metrics.limited" not in bar
+    assert "export default { cache_status, limited, report };" in files["/etc/nginx/packit_metrics.js"]
+
+
+def test_proxy_limits_load_njs():
+    options = {"proxy": {"limits": {"app": {"rate": "5r/s"}}}}
+    cfg = PackitConfig("config/novault", options=options)
+    files = proxy_render(cfg, cfg.proxy)
+    assert "load_module modules/ngx_http_js_module.so;" in files["/etc/nginx/nginx.conf"]
+    assert "zone=packit_default_app_requests:1m rate=5r/s;" in files["/etc/nginx/conf.d/default.conf"]
+
+
+def test_proxy_config_hash_tracks_content():
+    cfg = PackitConfig("config/multipackit")
+    files = proxy_render(cfg, cfg.proxy)
+    assert proxy_config_hash(files) == proxy_config_hash(dict(reversed(files.items())))
+    changed = {**files, "/etc/nginx/conf.d/default.conf": files["/etc/nginx/conf.d/default.conf"] + "\n"}
+    assert proxy_config_hash(changed) != proxy_config_hash(files)
+
+
+def test_templates_are_compiled_once(cache_dir, monkeypatch):
+
+    def render():
+        env = jinja2.Environment(
+            loader=jinja2.PackageLoader("packit_deploy"),
+            bytecode_cache=TemplateCache(),
+            autoescape=False,  # noqa: S701
+        )
+        return env.get_template("index.html.j2").render(instances=[])
+
+    expected = render()
+    assert len(list((cache_dir / "templates").iterdir())) == 1
+    monkeypatch.setattr(jinja2.Environment, "compile", mock.Mock(side_effect=Exception("compiled again")))
+    assert render() == expected
+
+
+class FakeProxy:
+    """
+    Just enough of a running proxy container to update its configuration.
+    """
+
+    def __init__(self, files, *, valid=True):
+        self.files = dict(files)
+        self.valid = valid
+        self.status = "running"
+        self.commands = []
+
+    def exec_run(self, args):
+        self.commands.append(args)
+        if args == ["nginx", "-t"] and not self.valid:
+            return ExecResult(1, b"nginx: [emerg] invalid configuration")
+        if args[:2] == ["rm", "-f"]:
+            for path in args[2:]:
+                self.files.pop(path, None)
+        return ExecResult(0, b"")
+
+
+@pytest.fixture
+def fake_files(mocker):
+    def write(data, container, path):
+        container.files[path] = data.decode("utf-8")
+
+    def read(container, path):
+        if path not in container.files:
+            raise docker.errors.NotFound(path)
+        return container.files[path]
+
+    mocker.patch.object(packit_constellation, "write_to_container", side_effect=write)
+    mocker.patch("constellation.docker_util.string_from_container", side_effect=read)
+
+
+def constellation_with_proxy(mocker, proxy):
+    obj = PackitConstellation(PackitConfig("config/multipackit"))
+    mocker.patch.object(obj, "_prepare", return_value={x.name: "fp" for x in obj.obj.containers.collection})
+    mocker.patch("packit_deploy.fingerprint.is_current", return_value=True)
+    mocker.patch.object(obj.obj.containers, "get", return_value=proxy)
+    mocker.patch("packit_deploy.fingerprint.orphaned_containers", return_value=[])
+    mocker.patch("docker.client.from_env")
+    return obj
+
+
+@pytest.mark.usefixtures("fake_files")
+def test_apply_leaves_unchanged_proxy_config_alone(mocker):
+    cfg = PackitConfig("config/multipackit")
+    proxy = FakeProxy({})
+    packit_constellation.write_proxy_config(proxy, proxy_render(cfg, cfg.proxy))
+    files = dict(proxy.files)
+    constellation_with_proxy(mocker, proxy).apply()
+    assert proxy.files == files
+    assert proxy.commands == []
+
+
+@pytest.mark.usefixtures("fake_files")
+def test_apply_removes_containers_no_longer_configured(mocker, capsys):
+    cfg = PackitConfig("config/multipackit")
+    proxy = FakeProxy({})
+    packit_constellation.write_proxy_config(proxy, proxy_render(cfg, cfg.proxy))
+    obj = constellation_with_proxy(mocker, proxy)
+    orphan = mock.Mock()
+    orphan.name = "packit-baz-packit-api"
+    packit_constellation.fingerprint.orphaned_containers.return_value = [orphan]
+    obj.apply()
+    orphan.stop.assert_called_once_with()
+    orphan.remove.assert_called_once_with()
+    assert "Removing packit-baz-packit-api, which is no longer in the configuration" in capsys.readouterr().out
+
+
+@pytest.mark.usefixtures("fake_files")
+def test_reload_proxy_validates_and_reloads(mocker):
+    proxy = FakeProxy({"/etc/nginx/conf.d/default.conf": "old"})
+    obj = constellation_with_proxy(mocker, proxy)
+    assert obj.reload_proxy()
+    assert proxy.commands == [["nginx", "-t"], ["nginx", "-s", "reload"]]
+    expected = proxy_render(obj.cfg, obj.cfg.proxy)
+    assert proxy.files["/etc/nginx/conf.d/default.conf"] == expected["/etc/nginx/conf.d/default.conf"]
+    assert proxy.files[packit_constellation.PROXY_CONFIG_HASH_PATH] == proxy_config_hash(expected)
+
+    proxy.commands.clear()
+    assert not obj.reload_proxy()
+    assert proxy.commands == []
+
+
+@pytest.mark.usefixtures("fake_files")
+def test_reload_proxy_restores_previous_config_if_invalid(mocker):
+    previous = {"/etc/nginx/conf.d/default.conf": "old", packit_constellation.PROXY_CONFIG_HASH_PATH: "abc"}
+    proxy = FakeProxy(previous, valid=False)
+    obj = constellation_with_proxy(mocker, proxy)
+    with pytest.raises(Exception, match="invalid configuration"):
+        obj.reload_proxy()
+    # index.html did not exist before, so is removed again
+    assert proxy.files == previous
+    assert ["nginx", "-s", "reload"] not in proxy.commands
+
+
+@pytest.mark.usefixtures("fake_files")
+def test_reload_proxy_regenerates_self_signed_certificate(mocker):
+    cfg = PackitConfig("config/multipackit")
+    cfg.acme_config = None
+    proxy = FakeProxy({})
+    packit_constellation.write_proxy_config(proxy, proxy_render(cfg, cfg.proxy))
+    obj = constellation_with_proxy(mocker, proxy)
+    obj.cfg.acme_config = None
+    obj.cfg.instances["baz"] = obj.cfg.instances["bar"]
+    assert obj.reload_proxy()
+    certificate = ["self-signed-certificate", "--hostnames", "/run/proxy"]
+    assert proxy.commands[0] == [*certificate, "localhost", "foo.localhost", "bar.localhost", "baz.localhost"]
+    assert proxy.commands[1:] == [["nginx", "-t"], ["nginx", "-s", "reload"]]
+
+    # With acme-buddy the certificate is left alone
+    proxy = FakeProxy({})
+    obj = constellation_with_proxy(mocker, proxy)
+    assert obj.reload_proxy()
+    assert proxy.commands == [["nginx", "-t"], ["nginx", "-s", "reload"]]
+
+
+def test_reload_proxy_requires_running_proxy(mocker):
+    obj = PackitConstellation(PackitConfig("config/multipackit"))
+    mocker.patch.object(obj.obj.containers, "get", return_value=None)
+    with pytest.raises(Exception, match="The proxy is not running"):
+        obj.reload_proxy()
+    obj = PackitConstellation(PackitConfig("config/noproxy"))
+    with pytest.raises(Exception, match="does not use a proxy"):
+        obj.reload_proxy()
@@ -0,0 +1,84 @@
+from unittest import mock
+
+import docker
+import pytest
+
+from packit_deploy.readiness import NotReadyError, exec_probe, health_probe, wait_until_ready
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, t):
+        self.sleeps.append(t)
+        self.now += t
+
+
+def test_waits_with_exponential_backoff(capsys):
+    clock = FakeClock()
+    container = mock.Mock(status="running")
+    probe = mock.Mock(side_effect=[False] * 6 + [True])
+    elapsed = wait_until_ready(container, probe, name="db", clock=clock, sleep=clock.sleep)
+    assert clock.sleeps == [0.05, 0.1, 0.2, 0.4, 0.8, 1]
+    assert elapsed == pytest.approx(2.55)
+    assert "[db] Ready after 2.55s" in capsys.readouterr().out
+
+
+def test_returns_immediately_if_ready():
+    clock = FakeClock()
+    wait_until_ready(mock.Mock(), lambda _: True, name="db", clock=clock, sleep=clock.sleep)
+    assert clock.sleeps == []
+
+
+def test_gives_up_after_timeout():
+    clock = FakeClock()
+    container = mock.Mock(status="running")
+    with pytest.raises(NotReadyError, match="'db' was not ready after 5s"):
+        wait_until_ready(container, lambda _: False, name="db", timeout=5, clock=clock, sleep=clock.sleep)
+    assert clock.now <= 5
+
+
+def test_optional_services_can_still_be_starting(capsys):
+    clock = FakeClock()
+    container = mock.Mock(status="running")
+    res = wait_until_ready(
+        container, lambda _: False, name="api", timeout=5, required=False, clock=clock, sleep=clock.sleep
+    )
+    assert res is None
+    assert "[api] Still starting after 5s" in capsys.readouterr().out
+
+    container = mock.Mock(status="exited")
+    with pytest.raises(NotReadyError, match="'api' stopped"):
+        wait_until_ready(container, lambda _: False, name="api", required=False, clock=clock, sleep=clock.sleep)
+
+
+def test_gives_up_if_container_stops():
+    clock = FakeClock()
+    container = mock.Mock(status="exited")
+    with pytest.raises(NotReadyError, match="'db' stopped \\(exited\\)"):
+        wait_until_ready(container, lambda _: False, name="db", clock=clock, sleep=clock.sleep)
+
+
+def test_exec_probe():
+    container = mock.Mock()
+    container.exec_run.return_value = mock.Mock(exit_code=0)
+    assert exec_probe(["true"])(container)
+    container.exec_run.assert_called_once_with(["true"])
+    container.exec_run.return_value = mock.Mock(exit_code=1)
+    assert not exec_probe(["true"])(container)
+    container.exec_run.side_effect = docker.errors.APIError("not running")
+    assert not exec_probe(["true"])(container)
+
+
+def test_health_probe():
+    container = mock.Mock(status="running", attrs={"State": {}})
+    assert health_probe(container)
+    container.attrs = {"State": {"Health": {"Status": "starting"}}}
+    assert not health_probe(container)
+    container.attrs = {"State": {"Health": {"Status": "healthy"}}}
+    assert health_probe(container)
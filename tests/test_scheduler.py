@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from packit_deploy.scheduler import run_graph
+
+
+def test_tasks_run_after_their_dependencies():
+    order = []
+    tasks = {name: (lambda name=name: order.append(name)) for name in ["a", "b", "c", "d"]}
+    dependencies = {"a": ["b"], "b": ["c", "d"]}
+    run_graph(tasks, dependencies, max_workers=4)
+    assert sorted(order) == ["a", "b", "c", "d"]
+    assert order.index("b") > order.index("c")
+    assert order.index("b") > order.index("d")
+    assert order.index("a") > order.index("b")
+
+
+def test_sequential_run_preserves_order():
+    order = []
+    tasks = {name: (lambda name=name: order.append(name)) for name in ["x", "y", "z"]}
+    run_graph(tasks, {}, max_workers=1)
+    assert order == ["x", "y", "z"]
+
+
+def test_concurrency_is_bounded():
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def task():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+
+    run_graph({str(i): task for i in range(8)}, {}, max_workers=3)
+    assert peak == 3
+
+
+def test_failure_stops_dependent_tasks():
+    ran = []
+
+    def fail():
+        msg = "some error"
+        raise Exception(msg)
+
+    tasks = {"a": fail, "b": lambda: ran.append("b")}
+    with pytest.raises(Exception, match="some error"):
+        run_graph(tasks, {"b": ["a"]}, max_workers=2)
+    assert ran == []
+
+
+def test_rejects_invalid_graphs():
+    tasks = {"a": lambda: None, "b": lambda: None}
+    with pytest.raises(Exception, match="Dependency cycle between tasks: a, b"):
+        run_graph(tasks, {"a": ["b"], "b": ["a"]}, max_workers=1)
+    with pytest.raises(Exception, match="Task 'a' depends on unknown tasks: c"):
+        run_graph(tasks, {"a": ["c"]}, max_workers=1)
+    with pytest.raises(Exception, match="'max_workers' must be at least 1"):
+        run_graph(tasks, {}, max_workers=0)
@@ -0,0 +1,97 @@
+import datetime as dt
+from unittest import mock
+
+from packit_deploy.config import PackitConfig
+from packit_deploy.packit_constellation import PackitConstellation
+from packit_deploy.status import collect_status
+
+NOW = dt.datetime(2025, 1, 1, 12, 0, 0, tzinfo=dt.timezone.utc)
+
+
+def listed(name, state="running", status="Up 2 hours"):
+    return {"Id": f"id-{name}", "Names": [f"/{name}"], "State": state, "Status": status, "ImageID": "sha256:abc"}
+
+
+def mock_client(containers, *, volumes=()):
+    client = mock.Mock()
+    client.api.containers.return_value = containers
+    client.api.networks.return_value = [{"Name": "packit-network"}]
+    client.api.volumes.return_value = {"Volumes": [{"Name": v} for v in volumes]}
+    client.api.inspect_container.side_effect = lambda container_id: {
+        "RestartCount": 3,
+        "State": {"Running": container_id != "id-packit-bar-packit-db", "StartedAt": "2025-01-01T10:00:00.123456789Z"},
+    }
+    return client
+
+
+def test_status_lists_containers_once_and_groups_by_instance():
+    obj = PackitConstellation(PackitConfig("config/multipackit"), resolve_secrets=False)
+    client = mock_client(
+        [listed("packit-foo-packit-api"), listed("packit-proxy"), listed("packit-bar-packit-db", "exited", "Exited")],
+        volumes=["packit_proxy_logs"],
+    )
+    res = collect_status(client, obj.obj, obj.instances)
+
+    assert client.api.containers.call_count == 1
+    assert client.api.containers.call_args == mock.call(all=True, filters={"name": "^/packit-"})
+    assert not client.api.inspect_container.called
+
+    assert list(res.instances.keys()) == ["foo", "bar"]
+    foo = {x.name: x for x in res.instances["foo"]}
+    assert foo["foo-packit-api"].state == "running"
+    assert foo["foo-packit-api"].container == "packit-foo-packit-api"
+    assert foo["foo-packit-api"].status == "Up 2 hours"
+    assert foo["foo-packit"].state == "missing"
+    assert foo["foo-packit"].container is None
+    assert {x.name: x.state for x in res.instances["bar"]}["bar-packit-db"] == "exited"
+    assert [(x.name, x.state) for x in res.shared] == [("proxy", "running"), ("acme-buddy", "missing")]
+    assert res.volumes["proxy_logs"] == ("packit_proxy_logs", True)
+    assert not res.volumes["foo/outpack"][1]
+
+
+def test_status_detail_includes_uptime_and_restarts():
+    obj = PackitConstellation(PackitConfig("config/multipackit"), resolve_secrets=False)
+    client = mock_client([listed("packit-foo-packit-api"), listed("packit-bar-packit-db", "exited", "Exited")])
+    res = collect_status(client, obj.obj, obj.instances, detail=True, clock=lambda: NOW)
+
+    assert client.api.inspect_container.call_count == 2
+    api = res.instances["foo"][2]
+    assert api.name == "foo-packit-api"
+    assert api.restart_count == 3
+    assert api.uptime == 7200
+    assert api.started_at == "2025-01-01T10:00:00.123456789Z"
+    db = res.instances["bar"][1]
+    assert db.restart_count == 3
+    assert db.uptime is None
+
+
+def test_status_matches_service_replicas():
+    obj = PackitConstellation(PackitConfig("config/complete"), resolve_secrets=False)
+    client = mock_client(
+        [
+            listed("packit-orderly-runner-worker-a1b2"),
+            listed("packit-orderly-runner-worker-c3d4"),
+            listed("packit-orderly-runner-api"),
+        ]
+    )
+    res = collect_status(client, obj.obj, obj.instances)
+    workers = [x.container for x in res.shared if x.name == "orderly-runner-worker"]
+    assert workers == ["packit-orderly-runner-worker-a1b2", "packit-orderly-runner-worker-c3d4"]
+
+
+def test_status_json_and_text_output():
+    obj = PackitConstellation(PackitConfig("config/noproxy"), resolve_secrets=False)
+    client = mock_client([listed("packit-packit-api")], volumes=["outpack_volume"])
+    res = collect_status(client, obj.obj, obj.instances)
+
+    dat = res.to_json()
+    assert dat["network"] == {"name": "packit-network", "exists": True}
+    assert dat["instances"][0]["name"] is None
+    assert dat["instances"][0]["containers"][2]["state"] == "running"
+    assert dat["shared"] == []
+
+    text = res.format()
+    assert "    - packit-api (packit-packit-api): running (Up 2 hours)" in text
+    assert "    - packit (missing): missing" in text
+    assert "    - outpack (outpack_volume): created" in text
+    assert "Shared" not in text
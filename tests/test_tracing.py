@@ -0,0 +1,125 @@
+import json
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+
+from packit_deploy import cli, tracing
+from packit_deploy.config import PackitConfig
+from packit_deploy.packit_constellation import PackitConstellation
+
+
+def test_span_is_noop_when_disabled():
+    assert tracing.active() is None
+    with tracing.span("anything", x=1):
+        pass
+
+
+def test_can_write_chrome_trace(tmp_path):
+    path = tmp_path / "trace.json"
+    with tracing.tracing(str(path)) as tracer:
+        assert tracing.active() is tracer
+        with tracing.span("pull", image="a:1"):
+            pass
+    assert tracing.active() is None
+
+    dat = json.loads(path.read_text())
+    names = [x["name"] for x in dat["traceEvents"]]
+    assert names == ["total", "pull"]
+    pull = dat["traceEvents"][1]
+    assert pull["ph"] == "X"
+    assert pull["args"] == {"image": "a:1"}
+    assert pull["dur"] >= 0
+
+
+def test_can_write_jsonl_trace(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    with tracing.tracing(str(path)):
+        with tracing.span("config"):
+            pass
+    lines = path.read_text().splitlines()
+    assert [json.loads(x)["name"] for x in lines] == ["total", "config"]
+
+
+def test_trace_is_written_on_failure(tmp_path, capsys):
+    path = tmp_path / "trace.json"
+    with pytest.raises(Exception, match="failed"):
+        with tracing.tracing(str(path)):
+            with tracing.span("start"):
+                msg = "failed"
+                raise Exception(msg)
+    assert path.exists()
+    assert "Wrote trace to" in capsys.readouterr().out
+
+
+def test_summary():
+    tracer = tracing.Tracer()
+    tracer.record("pull", 0, 2, image="a")
+    tracer.record("pull", 0, 1, image="b")
+    tracer.record("config", 0, 0.5)
+    lines = tracer.summary(slowest=1).splitlines()
+    assert lines[1].split() == ["pull", "2", "3.00", "1.50", "2.00"]
+    assert lines[2].split() == ["config", "1", "0.50", "0.50", "0.50"]
+    assert lines[-1].split() == ["2.00s", "pull", "image=a"]
+
+
+def test_container_start_is_split_into_phases():
+    obj = PackitConstellation(PackitConfig("config/noproxy"))
+    x = obj.obj.containers.find("packit-db")
+
+    def start(*_args):
+        x.preconfigure("container", None)
+        x.configure("container", None)
+
+    with mock.patch.object(x, "start", side_effect=start), mock.patch.object(x, "configure") as configure:
+        tracer = tracing.Tracer()
+        with mock.patch("packit_deploy.tracing._tracer", tracer):
+            obj._start_container(x)
+        configure.assert_called_once_with("container", None)
+        assert x.configure is configure
+
+    names = sorted(e["name"] for e in tracer.events)
+    assert names == ["configure", "container", "create", "start"]
+    assert all(e["args"] == {"container": "packit-db", "instance": None} for e in tracer.events)
+
+
+def test_spans_record_instance():
+    obj = PackitConstellation(PackitConfig("config/multipackit"))
+    containers = [mock.Mock(), mock.Mock()]
+    containers[0].name = "foo-packit-db"
+    containers[1].name = "proxy"
+    tracer = tracing.Tracer()
+    with mock.patch("packit_deploy.tracing._tracer", tracer):
+        with mock.patch.object(obj.obj.containers, "collection", containers):
+            obj.stop()
+    assert [e["args"] for e in tracer.events] == [
+        {"container": "foo-packit-db", "instance": "foo"},
+        {"container": "proxy"},
+    ]
+
+
+def test_summary_by_instance():
+    tracer = tracing.Tracer()
+    tracer.record("configure", 0, 2, container="foo-packit-api", instance="foo")
+    tracer.record("configure", 0, 1, container="bar-packit-api", instance="bar")
+    tracer.record("create", 0, 0.5, container="bar-packit-db", instance="bar")
+    tracer.record("configure", 0, 3, container="proxy")
+    tracer.record("configure", 0, 1, container="packit-api", instance=None)
+    lines = tracer.summary(slowest=0).splitlines()
+    assert lines[1].split() == ["configure", "4", "7.00", "1.75", "3.00"]
+    i = lines.index("") + 1
+    assert lines[i].split()[:2] == ["Instance", "Phase"]
+    assert [x.split()[:3] for x in lines[i + 1 : i + 5]] == [
+        ["(default)", "configure", "1"],
+        ["bar", "configure", "1"],
+        ["bar", "create", "1"],
+        ["foo", "configure", "1"],
+    ]
+
+
+def test_cli_can_trace_start(mocker, tmp_path):
+    mocker.patch("packit_deploy.cli._constellation")
+    path = tmp_path / "trace.json"
+    res = CliRunner().invoke(cli.cli, ["start", "--trace", str(path)])
+    assert res.exit_code == 0
+    assert path.exists()
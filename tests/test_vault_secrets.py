@@ -0,0 +1,141 @@
+from unittest import mock
+
+import pytest
+import vault_dev
+from constellation import vault
+from constellation.vault import VaultConfig
+from cryptography.fernet import Fernet
+
+from packit_deploy.config import PackitConfig
+from packit_deploy.packit_constellation import PackitConstellation
+from packit_deploy.vault_secrets import CachingVaultClient, SecretCache
+
+
+def mock_vault_config(secrets):
+    client = mock.Mock()
+    client.read.side_effect = lambda path: {"data": secrets[path]} if path in secrets else None
+    cfg = mock.Mock(spec=VaultConfig)
+    cfg.client.return_value = client
+    return cfg, client
+
+
+def test_client_reads_each_path_once():
+    cfg, client = mock_vault_config({"secret/db": {"user": "u", "password": "p"}})
+    cl = CachingVaultClient(cfg)
+    data = {"a": "VAULT:secret/db:user", "b": "VAULT:secret/db:password", "c": "VAULT:secret/db:user"}
+    vault.resolve_secrets(data, cl)
+    assert data == {"a": "u", "b": "p", "c": "u"}
+    assert cfg.client.call_count == 1
+    assert client.read.call_count == 1
+
+
+def test_client_does_not_authenticate_until_needed():
+    cfg, _ = mock_vault_config({})
+    data = {"a": "plain"}
+    vault.resolve_secrets(data, CachingVaultClient(cfg))
+    assert not cfg.client.called
+
+
+def test_client_reports_missing_secrets():
+    cfg, _ = mock_vault_config({})
+    with pytest.raises(Exception, match="Did not find secret at 'secret/missing'"):
+        vault.resolve_secrets({"a": "VAULT:secret/missing:x"}, CachingVaultClient(cfg))
+
+
+def test_secret_cache_round_trip(tmp_path):
+    key = Fernet.generate_key().decode()
+    now = 100.0
+    cache = SecretCache(tmp_path / "secrets", key, ttl=10, clock=lambda: now)
+    cache.set("secret/db", {"user": "u"})
+    cache.save()
+    assert b"secret/db" not in (tmp_path / "secrets").read_bytes()
+
+    reloaded = SecretCache(tmp_path / "secrets", key, ttl=10, clock=lambda: now)
+    assert reloaded.get("secret/db") == {"user": "u"}
+    now += 11
+    assert reloaded.get("secret/db") is None
+
+    # A different key just means an empty cache
+    other = SecretCache(tmp_path / "secrets", Fernet.generate_key().decode())
+    assert other.get("secret/db") is None
+
+
+def test_client_uses_secret_cache(tmp_path):
+    key = Fernet.generate_key().decode()
+    cfg, _ = mock_vault_config({"secret/db": {"user": "u"}})
+    data = {"a": "VAULT:secret/db:user"}
+    cl = CachingVaultClient(cfg, SecretCache(tmp_path / "secrets", key))
+    vault.resolve_secrets(data, cl)
+    assert data == {"a": "u"}
+    cl.save()
+
+    cfg, _ = mock_vault_config({})
+    data = {"a": "VAULT:secret/db:user"}
+    vault.resolve_secrets(data, CachingVaultClient(cfg, SecretCache(tmp_path / "secrets", key)))
+    assert data == {"a": "u"}
+    assert not cfg.client.called
+
+
+def test_client_saves_cache_once(tmp_path):
+    cfg, _ = mock_vault_config({"secret/a": {"x": "1"}, "secret/b": {"x": "2"}})
+    cache = SecretCache(tmp_path / "secrets", Fernet.generate_key().decode())
+    cl = CachingVaultClient(cfg, cache)
+    with mock.patch.object(cache, "save", wraps=cache.save) as save:
+        vault.resolve_secrets({"a": "VAULT:secret/a:x", "b": "VAULT:secret/b:x"}, cl)
+        assert not save.called
+        cl.save()
+        cl.save()
+        assert save.call_count == 1
+
+
+def test_secret_cache_ignores_unwritable_directory(tmp_path, capsys):
+    (tmp_path / "cache").write_text("not a directory")
+    cache = SecretCache(tmp_path / "cache" / "secrets", Fernet.generate_key().decode())
+    cache.set("secret/db", {"user": "u"})
+    cache.save()
+    assert "Could not save the vault secret cache" in capsys.readouterr().out
+
+
+def test_secret_cache_validates_ttl(monkeypatch):
+    monkeypatch.setenv("PACKIT_VAULT_CACHE_KEY", Fernet.generate_key().decode())
+    monkeypatch.setenv("PACKIT_VAULT_CACHE_TTL", "5m")
+    with pytest.raises(ValueError, match="Invalid PACKIT_VAULT_CACHE_TTL '5m', expected a number of seconds"):
+        SecretCache.from_environment("http://vault:8200")
+
+
+def test_secret_cache_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.setenv("PACKIT_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("PACKIT_VAULT_CACHE_KEY", raising=False)
+    assert SecretCache.from_environment("http://vault:8200") is None
+    monkeypatch.setenv("PACKIT_VAULT_CACHE_KEY", Fernet.generate_key().decode())
+    monkeypatch.setenv("PACKIT_VAULT_CACHE_TTL", "5")
+    cache = SecretCache.from_environment("http://vault:8200")
+    assert cache is not None
+    assert cache.ttl == 5
+    assert cache.path.parent == tmp_path
+
+
+def test_status_does_not_resolve_secrets():
+    cfg = PackitConfig("config/complete", options={"vault": {"addr": "http://vault:8200"}})
+    with mock.patch("packit_deploy.packit_constellation.CachingVaultClient") as client:
+        PackitConstellation(cfg, resolve_secrets=False)
+    assert not client.called
+
+
+def test_resolves_config_with_single_vault_login():
+    with vault_dev.Server() as s:
+        cl = s.client()
+        cl.write("secret/db/user", value="us3r")
+        cl.write("secret/db/password", value="p@ssword")
+        cl.write("secret/auth/githubclient/id", value="ghclientid")
+        cl.write("secret/auth/githubclient/secret", value="ghs3cret")
+        cl.write("secret/auth/jwt/secret", value="jwts3cret")
+        cl.write("secret/certbot-hdb/credentials", username="hdb-us3r", password="hdb-p@assword")
+
+        options = {"vault": {"addr": f"http://localhost:{s.port}", "auth": {"args": {"token": s.token}}}}
+        cfg = PackitConfig("config/complete", options=options)
+        with mock.patch.object(VaultConfig, "client", autospec=True, side_effect=VaultConfig.client) as login:
+            PackitConstellation(cfg)
+        assert login.call_count == 1
+        assert cfg.instances[None].packit_db.user == "us3r"
+        assert cfg.instances[None].packit_api.auth.jwt_secret == "jwts3cret"